@@ -1,10 +1,11 @@
 import os
-import requests
-from qgis.PyQt.QtWidgets import QVBoxLayout, QMessageBox, QLineEdit, QDialog, QVBoxLayout, QLabel, QFormLayout, QComboBox, QComboBox, QHBoxLayout, QProgressBar, QTextEdit, QDialog, QVBoxLayout, QPushButton, QListWidget, QListWidgetItem
+from qgis.PyQt.QtWidgets import QVBoxLayout, QMessageBox, QLineEdit, QDialog, QVBoxLayout, QLabel, QFormLayout, QComboBox, QComboBox, QHBoxLayout, QProgressBar, QDialog, QVBoxLayout, QPushButton, QListWidget, QListWidgetItem
 from qgis.PyQt.QtGui import QIcon
 from qgis.PyQt.QtCore import Qt
-from qgis.core import QgsProject
-from .util import app_http_login
+from qgis.core import QgsApplication, QgsProject
+from . import api, core
+from .LogView import LogView
+from .UploadTask import UploadTask
 
 class CreateDialog(QDialog):
     def __init__(self, config, selected_server=None, parent_console=None):
@@ -63,9 +64,9 @@ class CreateDialog(QDialog):
         form_layout.addRow("Access Groups:", self.access_groups_dropdown)
 
         button_box = QHBoxLayout()
-        create_btn = QPushButton("Create")
+        self.create_btn = QPushButton("Create")
         cancel_btn = QPushButton("Cancel")
-        button_box.addWidget(create_btn)
+        button_box.addWidget(self.create_btn)
         button_box.addWidget(cancel_btn)
         self.layout.addLayout(button_box)
     
@@ -75,18 +76,16 @@ class CreateDialog(QDialog):
         self.progress_bar.setVisible(False)
         self.layout.addWidget(self.progress_bar)
 
-        self.log_output = QTextEdit()
-        self.log_output.setReadOnly(True)
-        self.log_output.setMinimumHeight(120)
+        self.log_output = LogView()
         self.log_output.setVisible(False)
         self.layout.addWidget(self.log_output)
                     
         self.setLayout(self.layout)
         
-        create_btn.clicked.connect(self.create_store)
-        cancel_btn.clicked.connect(self.reject)
+        self.task = None
+        self.create_btn.clicked.connect(self.create_store)
+        cancel_btn.clicked.connect(self.onCancel)
         
-        self.s = requests.Session()
         self.onServerChanged()
 
 
@@ -99,16 +98,8 @@ class CreateDialog(QDialog):
         if not server_info or not isinstance(server_info, dict):
             self.access_groups_dropdown.clear()
             return
-        
-        proto = 'https' if server_info.get('port', 443) == 443 else 'http'
-        
-        try:
-            if not app_http_login(self.s, proto, server_info['host'], server_info['username'], server_info['password']):
-                QMessageBox.warning(None, "Login error", "Failed to login to with " + server_info['username'] + ' to ' + server_info['host'])
-        except Exception as e:
-            QMessageBox.warning(None, "HTTP error", "Failed on login: " + str(e))
-            return
 
+        # the access groups request logs in, if the cache doesn't have them
         self.updateAccessGroups()
 
     def updateAccessGroups(self):
@@ -132,27 +123,13 @@ class CreateDialog(QDialog):
     def get_access_groups(self, server_info):
         rv = {}
         
-        proto = 'https' if server_info['port'] == 443 else 'http'
         try:
-            response = self.s.post(proto + '://' + server_info['host'] + '/admin/action/access_group.php', data={'action':'list'}, timeout=(10, 30))
-            if response.status_code == 200:
-                response = response.json()
-                if response['success']:
-                    rv = response['access_groups']
-                else:
-                    QMessageBox.warning(None, "QCarta Error", response['message'])
+            rv = api.get_access_groups(server_info)
         except Exception as e:
-            QMessageBox.critical(None, "HTTP Error", f"An error occurred: {e}")
+            QMessageBox.warning(None, "QCarta Error", str(e))
 
         return rv
 
-    def read_in_chunks(self, file_object, chunk_size=65536):
-        while True:
-            data = file_object.read(chunk_size)
-            if not data:
-                break
-            yield data
-
     def create_store(self):
         server_name = self.selected_server
         store_name = self.store_name.text()
@@ -181,103 +158,46 @@ class CreateDialog(QDialog):
             QMessageBox.warning(self, "Missing Info", "Please select layer access groups.")
             return
 
-        proto = 'https' if server_info['port'] == 443 else 'http'
-
-        project_dir = os.path.dirname(project_path)
-        
-        qgs_list = []
-        file_list = []
-        try:
-            for root, _, files in os.walk(project_dir):
-                for file in files:
-                    local_path = os.path.join(root, file)
-                    relative_path = os.path.relpath(local_path, project_dir)
-                    
-                    if file.endswith('.qgs'):
-                        qgs_list.append(file)
-                        with open(local_path, 'rb') as f:
-                            offset = 0                            
-                            post_values={'action':'upload_bytes', 'source': os.path.basename(local_path)}
-
-                            for chunk in self.read_in_chunks(f):                                
-                                post_values['start'] = offset
-                                post_values['bytes'] = chunk
-                                response = self.s.post(proto + '://' + server_info['host'] + '/admin/action/upload.php', data=post_values, timeout=(10,30));
-                                if response.status_code != 200:
-                                    raise Exception("Chunk upload failed")
-                                offset = offset + len(chunk)
-                    else:
-                        file_list.append((local_path,relative_path));
-        except Exception as e:
-            QMessageBox.critical(None, "QGS Upload Failed", f"An error occurred: {e}")
-            return
-        
-        # upload .qgs files, so we can create store
-        post_values = {'action':'save', 'name': store_name, 'group_id[]': map_access_groups, 'source[]':qgs_list}
-        
-        response = self.s.post(proto + '://' + server_info['host'] + '/admin/action/qgs.php', data=post_values, timeout=(10,30))
-        if response.status_code != 200:
-            response = response.json();
-            QMessageBox.warning(None, "Create error", "Failed to create store: " + response['message'])
-            return
-
-        # now upload all other files
-        try:            
-            # show progress bar and output
-            self.progress_bar.setMaximum(len(file_list))
-            self.progress_bar.setVisible(True)
-            self.log_output.setVisible(True)
-
-            try:
-                response = self.s.get(proto + '://' + server_info['host'] + '/rest/store/' + store_name, timeout=(10, 30))
-            except Exception as e:
-                QMessageBox.warning(None, "HTTP error", "Failed to request store info: " + str(e))
-                return
-
-            if response.status_code != 200:
-                response = response.json();
-                QMessageBox.warning(None, "REST error", "Failed to get store info: " + response['message'])
-                return
-            
-            store_info = response.json()['store'];
-
-            chunk_size = store_info['post_max_size'] - 1000
-            store_created = True
-            
-            for i, (local_path,relative_path) in enumerate(file_list):
-                self.progress_bar.setValue(i + 1)
-                try:
-                    with open(local_path, 'rb') as f:
-                        offset = 0
-                        
-                        post_values={'action':'upload_bytes', 'source': os.path.basename(local_path)}
-                        
-                        for chunk in self.read_in_chunks(f):                                
-                            post_values['start'] = offset
-                            post_values['bytes'] = chunk
-                            response = self.s.post(proto + '://' + server_info['host'] + '/admin/action/upload.php', data=post_values, timeout=(10, 30));
-                            if response.status_code != 200:
-                                raise Exception("Chunk upload failed")
-                            offset = offset + len(chunk)
-                    
-                    post_values={'id':store_info['id'], 'action':'update_file', 'relative_path': relative_path, 'mtime': os.path.getmtime(local_path)}
-                    response = self.s.post(proto + '://' + server_info['host'] + '/admin/action/qgs.php', data=post_values, timeout=(10, 30));
-                    if response.status_code != 200:
-                        raise Exception("Store update failed")
-
-                    self.log_output.append(f"✔ Uploaded: {relative_path}")
-
-                except Exception as e:
-                    store_created = False
-                    self.log_output.append(f"✖ Failed to upload {relative_path}: {e}")
-            if store_created:
-                QMessageBox.information(self, "Create Complete", "Store created successfully.")
-                # Refresh store lists in other tabs
-                if self.parent_console:
-                    self.parent_console.refresh_store_lists()
-            else:
-                QMessageBox.critical(self, "Create Incomplete", "Store created failed.")
-
+        self.progress_bar.setMaximum(100)
+        self.progress_bar.setValue(0)
+        self.progress_bar.setFormat("%p%")
+        self.progress_bar.setVisible(True)
+        self.log_output.clear()
+        self.log_output.setVisible(True)
+        self.create_btn.setEnabled(False)
+
+        self.task = UploadTask("Create QCarta store " + store_name, lambda task: core.create_store(server_info, store_name, project_dir, map_access_groups, task))
+        self.task.messagesLogged.connect(self.onMessagesLogged)
+        self.task.progressChanged.connect(lambda progress: self.progress_bar.setValue(int(progress)))
+        self.task.statusChanged.connect(lambda status: self.progress_bar.setFormat("%p% - " + status))
+        self.task.taskCompleted.connect(self.onCreateFinished)
+        self.task.taskTerminated.connect(self.onCreateFinished)
+        QgsApplication.taskManager().addTask(self.task)
+
+    def onMessagesLogged(self, messages):
+        self.log_output.append_messages(messages)
+
+    def onCreateFinished(self):
+        task = self.task
+        self.task = None
+        self.create_btn.setEnabled(True)
+
+        if task.isCanceled():
+            self.log_output.appendPlainText("Create cancelled")
+        elif task.error:
+            QMessageBox.critical(None, "Create Failed", f"An error occurred: {task.error}")
+        elif task.result_value:
+            QMessageBox.information(self, "Create Complete", "Store created successfully.")
+            # Refresh store lists in other tabs
+            if self.parent_console:
+                self.parent_console.refresh_store_lists()
             self.accept()
-        except Exception as e:
-            QMessageBox.critical(None, "Upload Failed", f"An error occurred: {e}")
+        else:
+            QMessageBox.critical(self, "Create Incomplete", "Store created failed.")
+            self.accept()
+
+    def onCancel(self):
+        if self.task:
+            self.task.cancel()
+        else:
+            self.reject()
@@ -0,0 +1,143 @@
+from qgis.PyQt.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLineEdit, QCheckBox, QListView, QPushButton
+from qgis.PyQt.QtCore import Qt, QAbstractListModel, QModelIndex, QSortFilterProxyModel, QRegularExpression, QTimer
+
+# ms to wait after the last keystroke before filtering
+FILTER_DELAY = 200
+# rows laid out per step, so the view shows up before a long list is done
+LAYOUT_BATCH_SIZE = 500
+
+class LayerListModel(QAbstractListModel):
+    """
+    Layer names with a check state each.
+
+    Checked layers are kept as a set of rows, so they stay checked while
+    filtered out, and listing them costs only the number of checked layers.
+    """
+    def __init__(self):
+        super().__init__()
+        self.layers = []
+        self.checked = set()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.layers)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.DisplayRole:
+            return self.layers[index.row()]
+        if role == Qt.CheckStateRole:
+            return Qt.Checked if index.row() in self.checked else Qt.Unchecked
+        return None
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if not index.isValid() or role != Qt.CheckStateRole:
+            return False
+        if value == Qt.Checked:
+            self.checked.add(index.row())
+        else:
+            self.checked.discard(index.row())
+        self.dataChanged.emit(index, index, [Qt.CheckStateRole])
+        return True
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.NoItemFlags
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable | Qt.ItemIsUserCheckable
+
+    def set_layers(self, layers):
+        """Replace all layers in one reset, which is much cheaper than inserting them one by one"""
+        self.beginResetModel()
+        self.layers = layers
+        self.checked = set()
+        self.endResetModel()
+
+    def set_checked(self, rows, checked=True):
+        if checked:
+            self.checked.update(rows)
+        else:
+            self.checked.difference_update(rows)
+        if self.layers:
+            self.dataChanged.emit(self.index(0), self.index(len(self.layers) - 1), [Qt.CheckStateRole])
+
+    def checked_layers(self):
+        """Checked layer names in list order"""
+        return [self.layers[row] for row in sorted(self.checked)]
+
+class LayerPicker(QWidget):
+    """
+    Filterable list of layers to check.
+
+    The filter matches a substring, or a regular expression with Regex
+    checked, case insensitive either way, and runs FILTER_DELAY ms after
+    the last keystroke. The view lays out rows in batches with uniform
+    sizes, so it stays responsive with a hundred thousand layers.
+    """
+    def __init__(self):
+        super().__init__()
+        self.model = LayerListModel()
+        self.proxy = QSortFilterProxyModel()
+        self.proxy.setSourceModel(self.model)
+        self.proxy.setFilterCaseSensitivity(Qt.CaseInsensitive)
+
+        self.filter_field = QLineEdit()
+        self.filter_field.setPlaceholderText("Filter layers")
+        self.filter_field.setClearButtonEnabled(True)
+        self.regex_field = QCheckBox('Regex')
+        select_btn = QPushButton("Check shown")
+        clear_btn = QPushButton("Uncheck all")
+
+        self.view = QListView()
+        self.view.setModel(self.proxy)
+        self.view.setUniformItemSizes(True)
+        self.view.setLayoutMode(QListView.Batched)
+        self.view.setBatchSize(LAYOUT_BATCH_SIZE)
+
+        filter_box = QHBoxLayout()
+        filter_box.addWidget(self.filter_field)
+        filter_box.addWidget(self.regex_field)
+        filter_box.addWidget(select_btn)
+        filter_box.addWidget(clear_btn)
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addLayout(filter_box)
+        layout.addWidget(self.view)
+
+        self.filter_timer = QTimer(self)
+        self.filter_timer.setSingleShot(True)
+        self.filter_timer.setInterval(FILTER_DELAY)
+        self.filter_timer.timeout.connect(self.applyFilter)
+        self.filter_field.textChanged.connect(self.filter_timer.start)
+        self.regex_field.stateChanged.connect(self.applyFilter)
+        select_btn.clicked.connect(self.checkShown)
+        clear_btn.clicked.connect(lambda: self.model.set_checked(list(self.model.checked), False))
+
+    def applyFilter(self):
+        text = self.filter_field.text()
+        if self.regex_field.isChecked():
+            regex = QRegularExpression(text, QRegularExpression.CaseInsensitiveOption)
+            if not regex.isValid():
+                self.filter_field.setStyleSheet("color: #DC143C;")
+                return
+            self.filter_field.setStyleSheet("")
+            self.proxy.setFilterRegularExpression(regex)
+        else:
+            self.filter_field.setStyleSheet("")
+            self.proxy.setFilterFixedString(text)
+
+    def checkShown(self):
+        if self.proxy.rowCount() == self.model.rowCount():
+            self.model.set_checked(range(self.model.rowCount()))
+            return
+        rows = [self.proxy.mapToSource(self.proxy.index(i, 0)).row() for i in range(self.proxy.rowCount())]
+        self.model.set_checked(rows)
+
+    def set_layers(self, layers):
+        self.model.set_layers(layers)
+
+    def clear(self):
+        self.model.set_layers([])
+
+    def selected_layers(self):
+        return self.model.checked_layers()
@@ -0,0 +1,21 @@
+from qgis.PyQt.QtWidgets import QPlainTextEdit
+
+# lines kept in the log, older ones are dropped
+LOG_CAPACITY = 5000
+
+class LogView(QPlainTextEdit):
+    """
+    Read-only log of an upload.
+
+    Holds at most LOG_CAPACITY lines and takes messages in batches, so
+    logging thousands of files stays cheap and its memory bounded.
+    """
+    def __init__(self, capacity=LOG_CAPACITY):
+        super().__init__()
+        self.setReadOnly(True)
+        self.setMaximumBlockCount(capacity)
+        self.setMinimumHeight(120)
+
+    def append_messages(self, messages):
+        if messages:
+            self.appendPlainText("\n".join(messages))
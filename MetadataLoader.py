@@ -0,0 +1,46 @@
+from concurrent.futures import ThreadPoolExecutor
+from qgis.PyQt.QtCore import QObject, pyqtSignal
+
+class MetadataLoader(QObject):
+    """
+    Runs metadata requests concurrently off the GUI thread.
+
+    load(name, fn, *args) calls fn(*args) on a small thread pool, and
+    loaded(name, result, error) is emitted on the GUI thread as each call
+    finishes, error being the message of the exception it raised, or None.
+    """
+    loaded = pyqtSignal(str, object, object)
+
+    def __init__(self, workers=4):
+        super().__init__()
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.futures = []
+
+    def load(self, name, fn, *args):
+        self.futures = [future for future in self.futures if not future.done()]
+        self.futures.append(self.pool.submit(self.run, name, fn, args))
+
+    def run(self, name, fn, args):
+        try:
+            result = fn(*args)
+            error = None
+        except Exception as e:
+            result = None
+            error = str(e)
+        try:
+            self.loaded.emit(name, result, error)
+        except RuntimeError:
+            # the receiving dialog is gone
+            pass
+
+    def close(self):
+        """Drop pending requests, results of running ones are no longer emitted"""
+        try:
+            self.loaded.disconnect()
+        except TypeError:
+            pass
+        # shutdown(cancel_futures=True) needs Python 3.9, older QGIS ships 3.7
+        for future in self.futures:
+            future.cancel()
+        self.futures = []
+        self.pool.shutdown(wait=False)
@@ -1,10 +1,15 @@
 import os
-import requests
-from qgis.PyQt.QtWidgets import QVBoxLayout, QMessageBox, QLineEdit, QDialog, QVBoxLayout, QLabel, QFormLayout, QComboBox, QComboBox, QHBoxLayout, QProgressBar, QTextEdit, QDialog, QVBoxLayout, QPushButton, QCheckBox, QListWidget, QListWidgetItem, QSizePolicy
+from qgis.PyQt.QtWidgets import QVBoxLayout, QMessageBox, QFileDialog, QLineEdit, QDialog, QVBoxLayout, QLabel, QFormLayout, QComboBox, QComboBox, QHBoxLayout, QProgressBar, QTextEdit, QDialog, QVBoxLayout, QPushButton, QCheckBox, QListWidget, QListWidgetItem, QSizePolicy
 from qgis.PyQt.QtGui import QIcon
 from qgis.PyQt.QtCore import Qt
-from qgis.core import QgsProject
-from .util import app_http_login
+from qgis.core import QgsApplication, QgsProject
+from . import api, core
+from .batch import load_manifest, report_path, write_report
+from .prefetch import StorePrefetcher
+from .LayerPicker import LayerPicker
+from .LogView import LogView
+from .MetadataLoader import MetadataLoader
+from .UploadTask import UploadTask
 
 class PublishDialog(QDialog):
     def __init__(self, config, selected_server=None):
@@ -27,7 +32,9 @@ class PublishDialog(QDialog):
     
         form_layout = QFormLayout()
 
-        self.s = None
+        self.loader = None
+        self.prefetcher = StorePrefetcher()
+        self.shown_store_info = None
         self.stores = {}
         self.access_groups = {}
         self.basemaps = {}
@@ -41,10 +48,9 @@ class PublishDialog(QDialog):
             self.server_label.setStyleSheet("font-weight: bold; color: #DC143C;")
         
         self.store_dropdown = QComboBox()
-        self.store_dropdown.currentIndexChanged.connect(self.updateLayers)
+        self.store_dropdown.currentIndexChanged.connect(self.onStoreChanged)
     
-        self.layer_dropdown = QListWidget()
-        self.layer_dropdown.setSelectionMode(QListWidget.ExtendedSelection)
+        self.layer_picker = LayerPicker()
         self.print_layout_dropdown = QComboBox()
 
         # optional: give inputs some minimum width so the dialog must grow
@@ -88,6 +94,11 @@ class PublishDialog(QDialog):
         show_box.addWidget(self.show_dt)
         show_box.addWidget(self.show_fi_edit)
 
+        # layer flags by the name they are sent with
+        self.option_fields = {'public': self.option_public, 'cached': self.option_cached, 'proxyfied': self.option_proxyfied,
+            'customized': self.option_customized, 'exposed': self.option_exposed, 'auto_thumbnail': self.auto_generate_thumbnail,
+            'show_charts': self.show_charts, 'show_dt': self.show_dt, 'show_query': self.show_query, 'show_fi_edit': self.show_fi_edit}
+
         self.access_groups_dropdown = QListWidget()
         self.access_groups_dropdown.setSelectionMode(QListWidget.MultiSelection)
         
@@ -95,7 +106,7 @@ class PublishDialog(QDialog):
 
         form_layout.addRow(self.server_label)
         form_layout.addRow("Store:", self.store_dropdown)
-        form_layout.addRow("Layer:", self.layer_dropdown)
+        form_layout.addRow("Layer:", self.layer_picker)
         form_layout.addRow("Print Layout:", self.print_layout_dropdown)
 
         form_layout.addRow("Name:", self.layer_name)
@@ -114,10 +125,22 @@ class PublishDialog(QDialog):
     
         button_box = QHBoxLayout()
         create_btn = QPushButton("Create")
+        self.batch_btn = QPushButton("Batch Publish...")
         cancel_btn = QPushButton("Cancel")
         button_box.addWidget(create_btn)
+        button_box.addWidget(self.batch_btn)
         button_box.addWidget(cancel_btn)
         self.layout.addLayout(button_box)
+
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setMinimum(0)
+        self.progress_bar.setMaximum(100)
+        self.progress_bar.setVisible(False)
+        self.layout.addWidget(self.progress_bar)
+
+        self.log_output = LogView()
+        self.log_output.setVisible(False)
+        self.layout.addWidget(self.log_output)
             
         self.setLayout(self.layout)
     
@@ -129,85 +152,122 @@ class PublishDialog(QDialog):
         # let form fields expand
         form_layout.setFieldGrowthPolicy(QFormLayout.AllNonFixedFieldsGrow)
     
+        self.task = None
         create_btn.clicked.connect(self.create_layer)
-        cancel_btn.clicked.connect(self.reject)
+        self.batch_btn.clicked.connect(self.start_batch)
+        cancel_btn.clicked.connect(self.onCancel)
         
         # Call onServerChanged after all widgets are created
         self.onServerChanged()
     
     def onServerChanged(self):
-        if not self.selected_server or self.selected_server not in self.config:
-            self.store_dropdown.clear()
-            self.basemaps_dropdown.clear()
-            self.access_groups_dropdown.clear()
-            return
-            
-        server_info = self.config.get(self.selected_server, {})
-        if not server_info or not isinstance(server_info, dict):
+        # results still coming for the previous server are dropped with its loader
+        if self.loader:
+            self.loader.close()
+        self.loader = MetadataLoader()
+        self.loader.loaded.connect(self.onLoaded)
+
+        self.prefetcher.cancel()
+        if not self.server_info():
             self.store_dropdown.clear()
             self.basemaps_dropdown.clear()
             self.access_groups_dropdown.clear()
             return
-            
-        proto = 'https' if server_info.get('port', 443) == 443 else 'http'
-        
-        if self.s:
-            self.s.close()
-        self.s = requests.Session()
-        
-        try:
-            if not app_http_login(self.s, proto, server_info['host'], server_info['username'], server_info['password']):
-                QMessageBox.warning(None, "Login error", "Failed to login to with " + server_info['username'] + ' to ' + server_info['host'])
-                self.s.close()
-                self.s = None
-                return
-        except Exception as e:
-            QMessageBox.warning(None, "HTTP error", "Failed on login: " + str(e))
-            return
 
+        # these don't depend on each other, so they all load at once
         self.updateStores()
-        self.updateLayers()
         self.updateBasemaps()
         self.updateAccessGroups()
     
     def onProxyfiedChanged(self):
         self.option_exposed.setEnabled(self.option_proxyfied.isChecked())
 
-    def updateStores(self):
+    def server_info(self):
+        """Config of the selected server, None if there is none"""
         if not self.selected_server or self.selected_server not in self.config:
-            self.store_dropdown.clear()
-            return
-            
+            return None
         server_info = self.config.get(self.selected_server, {})
         if not server_info or not isinstance(server_info, dict):
+            return None
+        return server_info
+
+    def updateStores(self):
+        server_info = self.server_info()
+        if not server_info:
             self.store_dropdown.clear()
             return
-            
-        stores = self.get_stores(server_info)
-        stores.sort()
-        
-        self.store_dropdown.blockSignals(True)
-        self.store_dropdown.clear()
-        self.store_dropdown.addItems(stores)
-        self.store_dropdown.blockSignals(False)
+        self.loader.load('stores', api.get_stores, server_info)
     
+    def onStoreChanged(self):
+        server_info = self.server_info()
+        if server_info and self.store_dropdown.currentText():
+            api.use_store(server_info, self.store_dropdown.currentText())
+        self.updateLayers()
+
     def updateLayers(self):
-        if not self.selected_server or self.selected_server not in self.config:
-            self.layer_dropdown.clear()
+        server_info = self.server_info()
+        store_name = self.store_dropdown.currentText()
+        if not server_info or not store_name:
+            self.layer_picker.clear()
             self.print_layout_dropdown.clear()
             return
-            
-        server_info = self.config.get(self.selected_server, {})
-        if not server_info or not isinstance(server_info, dict):
-            self.layer_dropdown.clear()
-            self.print_layout_dropdown.clear()
+        # show cached info at once, even if it expired, and the current info once it's revalidated
+        cached = api.peek(server_info, 'store/' + store_name)
+        if cached is not None:
+            self.setLayers(cached)
+        self.loader.load('store:' + store_name, api.get_store_info, server_info, store_name)
+    
+    def updateBasemaps(self):
+        server_info = self.server_info()
+        if not server_info:
+            self.basemaps_dropdown.clear()
             return
-            
-        store_name = self.store_dropdown.currentText()
+        self.loader.load('basemaps', api.get_basemaps, server_info)
+    
+    def updateAccessGroups(self):
+        server_info = self.server_info()
+        if not server_info:
+            self.access_groups_dropdown.clear()
+            return
+        self.loader.load('access_groups', api.get_access_groups, server_info)
+
+    def onLoaded(self, name, result, error):
+        if error is not None:
+            QMessageBox.warning(None, "QCarta Error", name + ': ' + error)
+            return
+
+        if name == 'stores':
+            self.setStores(result)
+        elif name == 'basemaps':
+            self.setBasemaps(result)
+        elif name == 'access_groups':
+            self.setAccessGroups(result)
+        elif name == 'store:' + self.store_dropdown.currentText():
+            # info of a store that is no longer selected is ignored, and so is info already shown
+            if result != self.shown_store_info:
+                self.setLayers(result)
+
+    def setStores(self, stores):
+        self.stores = stores
+        names = list(stores.keys())
+        names.sort()
         
-        store_info = self.get_store_info(server_info,store_name)
+        current = self.store_dropdown.currentText()
+        self.store_dropdown.blockSignals(True)
+        self.store_dropdown.clear()
+        self.store_dropdown.addItems(names)
+        if current in stores:
+            self.store_dropdown.setCurrentText(current)
+        self.store_dropdown.blockSignals(False)
+        self.updateLayers()
+
+        # warm the cache, so switching stores doesn't wait for the network
+        self.prefetcher.start(self.server_info(), names)
+
+    def setLayers(self, store_info):
+        self.shown_store_info = store_info
         if not store_info or not isinstance(store_info, dict):
-            self.layer_dropdown.clear()
+            self.layer_picker.clear()
             return
         
         # Handle both string and list formats for Layers and Layouts
@@ -224,119 +284,34 @@ class PublishDialog(QDialog):
         else:
             print_layouts = layouts_data if isinstance(layouts_data, list) else []
         
-        self.layer_dropdown.blockSignals(True)
-        self.layer_dropdown.clear()
         layers.sort()
-        for l in layers:
-            self.layer_dropdown.addItem(QListWidgetItem(l))
-        self.layer_dropdown.blockSignals(False)
+        self.layer_picker.set_layers(layers)
         
         self.print_layout_dropdown.blockSignals(True)
         self.print_layout_dropdown.clear()
         print_layouts.sort()
         self.print_layout_dropdown.addItems(print_layouts)
         self.print_layout_dropdown.blockSignals(False)
-    
-    def updateBasemaps(self):
-        if not self.selected_server or self.selected_server not in self.config:
-            self.basemaps_dropdown.clear()
-            return
-            
-        server_info = self.config.get(self.selected_server, {})
-        if not server_info or not isinstance(server_info, dict):
-            self.basemaps_dropdown.clear()
-            return
 
+    def setBasemaps(self, basemaps):
         self.basemaps_dropdown.blockSignals(True)
         self.basemaps_dropdown.clear()
         
-        for g in self.get_basemaps(server_info):
+        self.basemaps = {}
+        for g in basemaps:
             self.basemaps[g['name']] = g['id']
             self.basemaps_dropdown.addItem(g['name'])
         self.basemaps_dropdown.blockSignals(False)
-    
-    def updateAccessGroups(self):
-        if not self.selected_server or self.selected_server not in self.config:
-            self.access_groups_dropdown.clear()
-            return
-            
-        server_info = self.config.get(self.selected_server, {})
-        if not server_info or not isinstance(server_info, dict):
-            self.access_groups_dropdown.clear()
-            return
 
+    def setAccessGroups(self, access_groups):
         self.access_groups_dropdown.blockSignals(True)
         self.access_groups_dropdown.clear()
         
-        for g in self.get_access_groups(server_info):
+        self.access_groups = {}
+        for g in access_groups:
             self.access_groups[g['name']] = g['id']
             self.access_groups_dropdown.addItem(QListWidgetItem(g['name']))
         self.access_groups_dropdown.blockSignals(False)
-    
-    def get_access_groups(self, server_info):
-        rv = {}
-        
-        proto = 'https' if server_info['port'] == 443 else 'http'
-        try:
-            response = self.s.post(proto + '://' + server_info['host'] + '/admin/action/access_group.php', data={'action':'list'}, timeout=(10, 30))
-            if response.status_code == 200:
-                response = response.json()
-                if response['success']:
-                    rv = response['access_groups']
-                else:
-                    QMessageBox.warning(None, "QCarta Error", 'get_access_groups:' + response['message'])
-        except Exception as e:
-            QMessageBox.critical(None, "HTTP Error", f"An error occurred: {e}")
-
-        return rv
-    
-    def get_basemaps(self, server_info):
-        rv = {}
-        
-        proto = 'https' if server_info['port'] == 443 else 'http'
-        try:
-            response = self.s.post(proto + '://' + server_info['host'] + '/admin/action/basemap.php', data={'action':'list'}, timeout=(10, 30))
-            if response.status_code == 200:
-                response = response.json()
-                if response['success']:
-                    rv = response['basemaps']
-                else:
-                    QMessageBox.warning(None, "QCarta Error", 'get_basemaps:' + response['message'])
-        except Exception as e:
-            QMessageBox.critical(None, "HTTP Error", f"An error occurred: {e}")
-
-        return rv
-
-    def get_stores(self, server_info):
-        
-        proto = 'https' if server_info['port'] == 443 else 'http'
-        try:
-            response = self.s.get(proto + '://' + server_info['host'] + '/rest/stores', timeout=(10, 30))
-            if response.status_code == 200:
-                response = response.json()
-                for s in response['stores']['store']:
-                    self.stores[s['name']] = s
-        except Exception as e:
-            QMessageBox.critical(None, "HTTP Error", f"An error occurred: {e}")
-
-        return list(self.stores.keys())
-    
-    def get_store_info(self, server_info, store_name):
-        rv = {}
-        
-        proto = 'https' if server_info['port'] == 443 else 'http'
-        try:
-            response = self.s.get(proto + '://' + server_info['host'] + '/rest/store/' + store_name, timeout=(10, 30))
-            if response.status_code == 200:
-                response = response.json()
-                if response['success']:
-                    rv = response['store']
-                else:
-                    QMessageBox.warning(None, "QCarta Error", 'get_store_info:' + response['message'])
-        except Exception as e:
-            QMessageBox.critical(None, "HTTP Error", f"An error occurred: {e}")
-
-        return rv
             
     def create_layer(self):
         server_name = self.selected_server
@@ -359,15 +334,8 @@ class PublishDialog(QDialog):
         for g in self.access_groups_dropdown.selectedItems():
             map_access_groups.append(self.access_groups[g.text()])
             
-        # QListWidget preserves the order of clicks in MultiSelection, so we get selected items through indexes
-        selectedIndexes = []
-        for idx in self.layer_dropdown.selectedIndexes():
-            selectedIndexes.append(idx.row())
-        selectedIndexes.sort()
-
-        qgis_layers = []
-        for i in selectedIndexes:
-            qgis_layers.append(self.layer_dropdown.item(i).text())
+        # checked layers in list order
+        qgis_layers = self.layer_picker.selected_layers()
 
         if not server_name or not layer_name:
             QMessageBox.warning(self, "Missing Info", "Please select a server in the Configure tab and enter a layer name.")
@@ -378,48 +346,79 @@ class PublishDialog(QDialog):
             return
 
         server_info = self.config[server_name]
-        proto = 'https' if server_info['port'] == 443 else 'http'
-        
-        try:
-            post_data = {'action':'save', 'id': 0, 'store_id': self.stores[store_name]['id'], 'layers[]': qgis_layers, 'name':layer_name, 'description':layer_desc, 'print_layout': print_layout, 'group_id[]':map_access_groups}
-            if basemap_id is not None:
-                post_data['basemap_id'] = basemap_id
-            if self.option_public.isChecked():
-                post_data['public'] = 't'
-            if self.option_cached.isChecked():
-                post_data['cached'] = 't'
-            if self.option_proxyfied.isChecked():
-                post_data['proxyfied'] = 't'
-            if self.option_customized.isChecked():
-                post_data['customized'] = 't'
-            if self.option_exposed.isChecked():
-                post_data['exposed'] = 't'
-            if self.auto_generate_thumbnail.isChecked():
-                post_data['auto_thumbnail'] = 't'
-            
-            if self.show_charts.isChecked():
-                post_data['show_charts'] = 't'
-            if self.show_dt.isChecked():
-                post_data['show_dt'] = 't'
-            if self.show_query.isChecked():
-                post_data['show_query'] = 't'
-            if self.show_fi_edit.isChecked():
-                post_data['show_fi_edit'] = 't'
-
-            response = self.s.post(proto + '://' + server_info['host'] + '/admin/action/qgs_layer.php', data=post_data, timeout=(10, 30))
-            if response.status_code != 200:
-                QMessageBox.warning(None, "HTTP error", "HTTP code " + str(response.status_code))
-                return
-
-            response = response.json();
-            if response['success']:
-                layer_url = proto + '://' + server_info['host'] + '/layers/' + response['id'] + '/index.php';
-                QMessageBox.information(None, "AcuGIS QCarta", 'Layer published. You can view it at <a href="' + layer_url +'">' + layer_url + '</a>')
-            else:
-                QMessageBox.warning(None, "QCarta error", response['message'])
+        options = [option for option, field in self.option_fields.items() if field.isChecked()]
 
+        try:
+            layer_id = api.publish_layer(server_info, self.stores[store_name]['id'], qgis_layers, layer_name, layer_desc, print_layout, map_access_groups, basemap_id, options)
         except Exception as e:
-            QMessageBox.warning(None, "HTTP error", "HTTP code " + str(response.status_code))
+            QMessageBox.warning(None, "QCarta error", str(e))
             return
 
+        api.invalidate(server_info, 'store/' + store_name)
+        api.use_store(server_info, store_name)
+        layer_url = api.layer_url(server_info, layer_id)
+        QMessageBox.information(None, "AcuGIS QCarta", 'Layer published. You can view it at <a href="' + layer_url +'">' + layer_url + '</a>')
+
         self.accept()
+
+    def start_batch(self):
+        server_info = self.server_info()
+        if not server_info:
+            QMessageBox.warning(self, "Missing Info", "Please select a server in the Configure tab.")
+            return
+
+        manifest_path, _ = QFileDialog.getOpenFileName(self, "Batch publish manifest", "", "Manifests (*.csv *.json)")
+        if not manifest_path:
+            return
+        try:
+            rows = load_manifest(manifest_path)
+        except Exception as e:
+            QMessageBox.warning(self, "Invalid manifest", f"Failed to read {manifest_path}: {e}")
+            return
+
+        self.run_batch(server_info, rows, report_path(manifest_path))
+
+    def run_batch(self, server_info, rows, report):
+        self.progress_bar.setValue(0)
+        self.progress_bar.setVisible(True)
+        self.log_output.clear()
+        self.log_output.setVisible(True)
+        self.batch_btn.setEnabled(False)
+
+        self.task = UploadTask("Publish QCarta layers", lambda task: core.publish_layers(server_info, rows, task))
+        self.task.messagesLogged.connect(self.onMessagesLogged)
+        self.task.progressChanged.connect(lambda progress: self.progress_bar.setValue(int(progress)))
+        self.task.taskCompleted.connect(lambda: self.onBatchFinished(server_info, rows, report))
+        self.task.taskTerminated.connect(lambda: self.onBatchFinished(server_info, rows, report))
+        QgsApplication.taskManager().addTask(self.task)
+
+    def onMessagesLogged(self, messages):
+        self.log_output.append_messages(messages)
+
+    def onBatchFinished(self, server_info, rows, report):
+        task = self.task
+        self.task = None
+        self.batch_btn.setEnabled(True)
+
+        if task.error:
+            QMessageBox.critical(None, "Batch Publish Failed", f"An error occurred: {task.error}")
+            return
+
+        try:
+            write_report(report, rows)
+        except Exception as e:
+            self.log_output.appendPlainText(f"Failed to write report {report}: {e}")
+
+        failed = len([row for row in rows if row.get('status') != 'ok'])
+        if task.isCanceled():
+            self.log_output.appendPlainText("Batch publish cancelled")
+        elif failed == 0:
+            QMessageBox.information(self, "Batch Publish Complete", f"{len(rows)} layers published. Report: {report}")
+        elif QMessageBox.question(self, "Batch Publish Incomplete", f"{failed} of {len(rows)} layers failed, see {report}.\nRetry the failed layers?") == QMessageBox.Yes:
+            self.run_batch(server_info, rows, report)
+
+    def onCancel(self):
+        if self.task:
+            self.task.cancel()
+        else:
+            self.reject()
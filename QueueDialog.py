@@ -0,0 +1,259 @@
+import os
+from qgis.PyQt.QtWidgets import QVBoxLayout, QMessageBox, QFileDialog, QInputDialog, QDialog, QLabel, QHBoxLayout, QPushButton, QSpinBox, QTableWidget, QTableWidgetItem, QAbstractItemView, QHeaderView
+from qgis.PyQt.QtGui import QIcon
+from qgis.PyQt.QtCore import Qt, QObject, QTimer, pyqtSignal
+from qgis.core import QgsApplication, QgsProject
+from . import api, core
+from .jobqueue import JobQueue, JobRunner, read_jobs
+from .LogView import LogView
+from .UploadTask import UploadTask
+
+# ms between refreshes of the job table
+REFRESH_INTERVAL = 1000
+
+class QueueRunner(QObject):
+    """
+    Runs the job queue in a background task owned by the plugin, so jobs
+    go on while the console is closed. The task's messages are passed on
+    through messagesLogged, and runningChanged tells when it starts and stops.
+    """
+    messagesLogged = pyqtSignal(list)
+    runningChanged = pyqtSignal(bool)
+
+    def __init__(self):
+        super().__init__()
+        self.queue = JobQueue()
+        self.task = None
+
+    def is_running(self):
+        return self.task is not None
+
+    def start(self):
+        if self.task:
+            return
+        # servers as saved now, jobs name the server they run on
+        servers = core.load_config()
+        self.task = UploadTask("QCarta job queue", lambda task: JobRunner(self.queue, servers, task).run())
+        self.task.messagesLogged.connect(self.messagesLogged.emit)
+        self.task.taskCompleted.connect(self.onFinished)
+        self.task.taskTerminated.connect(self.onFinished)
+        QgsApplication.taskManager().addTask(self.task)
+        self.runningChanged.emit(True)
+
+    def stop(self):
+        """Stop after the current chunks, running jobs stay pending"""
+        if self.task:
+            self.task.cancel()
+
+    def onFinished(self):
+        task = self.task
+        self.task = None
+        if task.isCanceled():
+            self.messagesLogged.emit(["Queue stopped"])
+        elif task.error:
+            self.messagesLogged.emit([f"✖ Queue failed: {task.error}"])
+        else:
+            self.messagesLogged.emit([f"Queue finished, {task.result_value or 0} jobs failed"])
+        self.runningChanged.emit(False)
+
+runner = None
+
+def get_runner():
+    """The QueueRunner of the plugin"""
+    global runner
+    if runner is None:
+        runner = QueueRunner()
+    return runner
+
+class QueueDialog(QDialog):
+    def __init__(self, config, selected_server=None):
+        super().__init__()
+
+        self.config = config
+        self.selected_server = selected_server
+        self.runner = get_runner()
+        self.queue = self.runner.queue
+        self.shown_version = None
+        self.setWindowTitle("QCarta job queue")
+        self.layout = QVBoxLayout()
+        self.layout.setContentsMargins(3, 3, 4, 4)
+        self.layout.setSpacing(4)
+
+        logo_path = os.path.join(os.path.dirname(__file__), 'logo.png')
+        if os.path.exists(logo_path):
+            logo_label = QLabel()
+            logo_label.setPixmap(QIcon(logo_path).pixmap(120, 40))
+            logo_label.setAlignment(Qt.AlignLeft | Qt.AlignTop)
+            logo_label.setContentsMargins(6, 6, 0, 0)
+            self.layout.addWidget(logo_label)
+
+        branding_label = QLabel(
+            "<b style='font-size:14pt;'>Job Queue</b><br>"
+            "<span style='font-size:10pt;'>Update many stores in the background</span>"
+        )
+        branding_label.setAlignment(Qt.AlignCenter)
+        branding_label.setContentsMargins(0, -10, 0, 0)
+        self.layout.addWidget(branding_label)
+
+        # Show selected server as label instead of dropdown
+        if selected_server and selected_server in config:
+            self.server_label = QLabel(f"Server: {selected_server}")
+            self.server_label.setStyleSheet("font-weight: bold; color: #2E8B57;")
+        else:
+            self.server_label = QLabel("Server: No server selected")
+            self.server_label.setStyleSheet("font-weight: bold; color: #DC143C;")
+        self.layout.addWidget(self.server_label)
+
+        self.table = QTableWidget(0, 4)
+        self.table.setHorizontalHeaderLabels(["Server", "Store", "Project Directory", "Status"])
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.horizontalHeader().setSectionResizeMode(2, QHeaderView.Stretch)
+        self.layout.addWidget(self.table)
+
+        add_box = QHBoxLayout()
+        add_dir_btn = QPushButton("Add Directory...")
+        add_project_btn = QPushButton("Add Current Project")
+        import_btn = QPushButton("Import CSV...")
+        remove_btn = QPushButton("Remove")
+        retry_btn = QPushButton("Retry")
+        clear_btn = QPushButton("Clear Done")
+        for btn in (add_dir_btn, add_project_btn, import_btn, remove_btn, retry_btn, clear_btn):
+            add_box.addWidget(btn)
+        self.layout.addLayout(add_box)
+
+        run_box = QHBoxLayout()
+        run_box.addWidget(QLabel("Parallel uploads:"))
+        self.budget_field = QSpinBox()
+        self.budget_field.setRange(1, 64)
+        self.budget_field.setValue(self.queue.budget)
+        run_box.addWidget(self.budget_field)
+        run_box.addStretch()
+        self.start_btn = QPushButton()
+        run_box.addWidget(self.start_btn)
+        self.layout.addLayout(run_box)
+
+        self.log_output = LogView()
+        self.layout.addWidget(self.log_output)
+
+        self.setLayout(self.layout)
+
+        add_dir_btn.clicked.connect(self.addDirectory)
+        add_project_btn.clicked.connect(self.addCurrentProject)
+        import_btn.clicked.connect(self.importCsv)
+        remove_btn.clicked.connect(lambda: self.queue.remove(self.selected_ids()))
+        retry_btn.clicked.connect(self.retry)
+        clear_btn.clicked.connect(self.queue.clear_finished)
+        self.budget_field.valueChanged.connect(self.queue.set_budget)
+        self.start_btn.clicked.connect(self.onStartStop)
+        self.runner.messagesLogged.connect(self.log_output.append_messages)
+        self.runner.runningChanged.connect(self.onRunningChanged)
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(REFRESH_INTERVAL)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start()
+        self.onRunningChanged(self.runner.is_running())
+        self.refresh()
+
+    def onServerChanged(self):
+        pass
+
+    def server_info(self):
+        server_info = self.config.get(self.selected_server) if self.selected_server else None
+        return server_info if isinstance(server_info, dict) else None
+
+    def refresh(self):
+        self.queue.refresh()
+        if self.queue.version == self.shown_version:
+            return
+        self.shown_version = self.queue.version
+        jobs = self.queue.snapshot()
+        self.table.setRowCount(len(jobs))
+        for row, job in enumerate(jobs):
+            values = [job['server'], job['store'], job['project_dir'], self.status_text(job)]
+            for column, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                item.setData(Qt.UserRole, job['id'])
+                self.table.setItem(row, column, item)
+
+    def status_text(self, job):
+        status = job['status']
+        if job['kind'] == 'create' and status == 'pending':
+            return "pending create"
+        if status == 'running':
+            return f"running {100 * job.get('progress', 0):.0f}%"
+        if status == 'done' and job.get('result') is None:
+            return "up to date"
+        if status == 'failed':
+            return "failed: " + (job.get('error') or '')
+        return status
+
+    def selected_ids(self):
+        rows = set(index.row() for index in self.table.selectedIndexes())
+        return set(self.table.item(row, 0).data(Qt.UserRole) for row in rows)
+
+    def ask_store(self, project_dir):
+        """Store to sync a directory to, picked from the selected server's stores"""
+        server_info = self.server_info()
+        if not server_info:
+            QMessageBox.warning(self, "Missing Info", "Please select a server in the Configure tab.")
+            return None
+        try:
+            stores = sorted(api.get_stores(server_info).keys())
+        except Exception as e:
+            QMessageBox.critical(None, "HTTP Error", f"An error occurred: {e}")
+            return None
+
+        name = os.path.basename(os.path.normpath(project_dir))
+        store_name, ok = QInputDialog.getItem(self, "Store", f"Store to update from {project_dir}:", stores, stores.index(name) if name in stores else 0, True)
+        return store_name if ok and store_name else None
+
+    def addDirectory(self):
+        project_dir = QFileDialog.getExistingDirectory(self, "Project directory")
+        if project_dir:
+            store_name = self.ask_store(project_dir)
+            if store_name:
+                self.queue.add('sync', self.selected_server, store_name, project_dir)
+
+    def addCurrentProject(self):
+        project_path = QgsProject.instance().fileName()
+        if not project_path:
+            QMessageBox.warning(None, "No Project", "Please save the QGIS project first.")
+            return
+        project_dir = os.path.dirname(project_path)
+        store_name = self.ask_store(project_dir)
+        if store_name:
+            self.queue.add('sync', self.selected_server, store_name, project_dir)
+
+    def importCsv(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Jobs", "", "CSV (*.csv)")
+        if not path:
+            return
+        try:
+            jobs = read_jobs(path)
+        except Exception as e:
+            QMessageBox.critical(self, "Import Failed", f"Failed to read jobs: {e}")
+            return
+        if any(job['server'] is None for job in jobs) and not self.server_info():
+            QMessageBox.warning(self, "Missing Info", "Please select a server in the Configure tab, or add a server column.")
+            return
+        for job in jobs:
+            self.queue.add(job['kind'], job['server'] or self.selected_server, job['store'], job['project_dir'], job['access_groups'])
+        self.log_output.appendPlainText(f"Added {len(jobs)} jobs from {path}")
+
+    def retry(self):
+        self.queue.retry(self.selected_ids())
+        if not self.runner.is_running():
+            self.runner.start()
+
+    def onStartStop(self):
+        if self.runner.is_running():
+            self.runner.stop()
+            self.start_btn.setEnabled(False)
+        else:
+            self.runner.start()
+
+    def onRunningChanged(self, running):
+        self.start_btn.setText("Stop" if running else "Start")
+        self.start_btn.setEnabled(True)
@@ -1,9 +1,10 @@
 import os
 import requests
-from qgis.PyQt.QtWidgets import QDialog, QMessageBox, QPushButton, QVBoxLayout, QLabel, QFormLayout, QLineEdit, QHBoxLayout
+from qgis.PyQt.QtWidgets import QDialog, QMessageBox, QPushButton, QVBoxLayout, QLabel, QFormLayout, QLineEdit, QHBoxLayout, QCheckBox
 from qgis.PyQt.QtGui import QIcon
 from qgis.PyQt.QtCore import Qt, QTimer
 from .util import app_http_login
+from .transfer import DEFAULT_WORKERS, MAX_WORKERS, server_workers
 
 class ServerConfigModal(QDialog):
     def __init__(self, config, server_name=None, parent=None):
@@ -15,7 +16,7 @@ class ServerConfigModal(QDialog):
         # Set window properties
         self.setWindowTitle("Edit Server" if self.is_edit_mode else "Add New Server")
         self.setModal(True)
-        self.setFixedSize(400, 300)
+        self.setFixedSize(400, 510)
         
         # Create layout
         self.layout = QVBoxLayout()
@@ -37,6 +38,14 @@ class ServerConfigModal(QDialog):
         self.password_field.setEchoMode(QLineEdit.Password)
         self.port_field = QLineEdit()
         self.port_field.setText("443")  # Default port
+        self.workers_field = QLineEdit()
+        self.workers_field.setText(str(DEFAULT_WORKERS))
+        self.compare_hashes_field = QCheckBox('Skip files with identical content')
+        self.delta_field = QCheckBox('Send only changed blocks of large files')
+        self.bundle_field = QCheckBox('Send small files together in bundles')
+        self.batch_commits_field = QCheckBox('Commit many files per request')
+        self.disk_cache_field = QCheckBox('Keep server metadata between sessions')
+        self.referenced_only_field = QCheckBox('Upload only files the projects reference')
         
         # Add rows to form
         self.form_layout.addRow("Server Name:", self.server_name_field)
@@ -44,6 +53,13 @@ class ServerConfigModal(QDialog):
         self.form_layout.addRow("Username:", self.username_field)
         self.form_layout.addRow("Password:", self.password_field)
         self.form_layout.addRow("Port (default 443):", self.port_field)
+        self.form_layout.addRow(f"Parallel uploads (1-{MAX_WORKERS}):", self.workers_field)
+        self.form_layout.addRow("Compare contents:", self.compare_hashes_field)
+        self.form_layout.addRow("Delta uploads:", self.delta_field)
+        self.form_layout.addRow("Bundle uploads:", self.bundle_field)
+        self.form_layout.addRow("Batch commits:", self.batch_commits_field)
+        self.form_layout.addRow("Disk cache:", self.disk_cache_field)
+        self.form_layout.addRow("Referenced files only:", self.referenced_only_field)
         
         self.layout.addLayout(self.form_layout)
         
@@ -83,6 +99,13 @@ class ServerConfigModal(QDialog):
             self.username_field.setText(server_info.get('username', ''))
             self.password_field.setText(server_info.get('password', ''))
             self.port_field.setText(str(server_info.get('port', '443')))
+            self.workers_field.setText(str(server_workers(server_info)))
+            self.compare_hashes_field.setChecked(server_info.get('compare_hashes', False))
+            self.delta_field.setChecked(server_info.get('delta', False))
+            self.bundle_field.setChecked(server_info.get('bundle', False))
+            self.batch_commits_field.setChecked(server_info.get('batch_commits', False))
+            self.disk_cache_field.setChecked(server_info.get('disk_cache', False))
+            self.referenced_only_field.setChecked(server_info.get('referenced_only', False))
     
     def save_server(self):
         """Save the server configuration"""
@@ -101,7 +124,14 @@ class ServerConfigModal(QDialog):
             'host': self.host_field.text().strip(),
             'username': self.username_field.text().strip(),
             'password': self.password_field.text().strip(),
-            'port': int(self.port_field.text().strip()) if self.port_field.text().strip().isdigit() else 443
+            'port': int(self.port_field.text().strip()) if self.port_field.text().strip().isdigit() else 443,
+            'workers': server_workers({'workers': self.workers_field.text().strip()}),
+            'compare_hashes': self.compare_hashes_field.isChecked(),
+            'delta': self.delta_field.isChecked(),
+            'bundle': self.bundle_field.isChecked(),
+            'batch_commits': self.batch_commits_field.isChecked(),
+            'disk_cache': self.disk_cache_field.isChecked(),
+            'referenced_only': self.referenced_only_field.isChecked()
         }
         
         # If we renamed the server, remove the old entry
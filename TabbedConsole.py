@@ -9,6 +9,7 @@ from .ConfigDialog import ConfigDialog
 from .CreateDialog import CreateDialog
 from .UploadDialog import UploadDialog
 from .PublishDialog import PublishDialog
+from .QueueDialog import QueueDialog
 
 class QCartaConsole(QDialog):
     """
@@ -17,6 +18,7 @@ class QCartaConsole(QDialog):
       - Create Store
       - Update Store
       - Publish Map
+      - Queue
     """
     def __init__(self, config, parent=None, save_callback=None):
         super().__init__(parent)
@@ -75,7 +77,7 @@ class QCartaConsole(QDialog):
         self.setup_tabs(config)
         
         # Connect selection change
-        self.tab_list.currentRowChanged.connect(self.content_stack.setCurrentIndex)
+        self.tab_list.currentRowChanged.connect(self.onTabChanged)
         
         # Connect to config dialog's server selection change
         if "Configure" in self.dialogs:
@@ -92,8 +94,10 @@ class QCartaConsole(QDialog):
             ("Create Store", CreateDialog, "create.png"), 
             ("Publish", PublishDialog, "publish.png"),
             ("Update Store", UploadDialog, "update.png"),		
+            ("Queue", QueueDialog, "update.png"),
         ]
         
+        self.tab_items = tab_items
         for i, (title, dialog_cls, icon_name) in enumerate(tab_items):
             # Create icon
             icon_path = os.path.join(icon_dir, icon_name)
@@ -103,39 +107,55 @@ class QCartaConsole(QDialog):
             item = QListWidgetItem(icon, title)
             self.tab_list.addItem(item)
             
-            # Create dialog
-            if title == "Configure":
-                dlg = dialog_cls(config, self.save_callback)
-            elif title == "Create Store":
-                # Pass selected server and parent console to CreateDialog
-                selected_server = config.get('_selected_server')
-                dlg = dialog_cls(config, selected_server, self)
-            else:
-                # Pass selected server to other dialogs
-                selected_server = config.get('_selected_server')
-                dlg = dialog_cls(config, selected_server)
-            dlg.setWindowFlags(Qt.Widget)
-            # Neutralize accept/reject so inner dialogs don't close the whole console
-            dlg.accept = lambda *a, **k: None
-            dlg.reject = lambda *a, **k: None
-            
-            # Create container widget
+            # Create container widget, the dialog is added when the tab is first shown
             container = QWidget()
             layout = QVBoxLayout(container)
             layout.setContentsMargins(0, 0, 0, 0)
             layout.setSpacing(0)
-            layout.addWidget(dlg)
-            layout.addStretch()  # Push content to top
             
             # Add to stacked widget
             self.content_stack.addWidget(container)
-            self.dialogs[title] = dlg
         
         # Select first tab
+        self.create_tab(0)
         self.tab_list.setCurrentRow(0)
     
+    def onTabChanged(self, row):
+        """Create the dialog of a tab on first activation, then show it"""
+        self.create_tab(row)
+        self.content_stack.setCurrentIndex(row)
+    
+    def create_tab(self, row):
+        if row < 0 or row >= len(self.tab_items):
+            return
+        title, dialog_cls, icon_name = self.tab_items[row]
+        if title in self.dialogs:
+            return
+        
+        # Create dialog
+        config = self.config
+        if title == "Configure":
+            dlg = dialog_cls(config, self.save_callback)
+        elif title == "Create Store":
+            # Pass selected server and parent console to CreateDialog
+            selected_server = config.get('_selected_server')
+            dlg = dialog_cls(config, selected_server, self)
+        else:
+            # Pass selected server to other dialogs
+            selected_server = config.get('_selected_server')
+            dlg = dialog_cls(config, selected_server)
+        dlg.setWindowFlags(Qt.Widget)
+        # Neutralize accept/reject so inner dialogs don't close the whole console
+        dlg.accept = lambda *a, **k: None
+        dlg.reject = lambda *a, **k: None
+        
+        layout = self.content_stack.widget(row).layout()
+        layout.addWidget(dlg)
+        layout.addStretch()  # Push content to top
+        self.dialogs[title] = dlg
+    
     def update_other_tabs(self, selected_server):
-        """Update other tabs when server selection changes in Configure tab"""
+        """Update other tabs when server selection changes in Configure tab, tabs not created yet pick it up from config"""
         # Update the config with the new selected server
         self.config['_selected_server'] = selected_server
         
@@ -160,7 +180,7 @@ class QCartaConsole(QDialog):
                     dialog.onServerChanged()
     
     def refresh_store_lists(self):
-        """Refresh store lists in all dialogs that have them"""
+        """Refresh store lists in all created dialogs that have them"""
         for title, dialog in self.dialogs.items():
             if hasattr(dialog, 'updateStores'):
                 dialog.updateStores()
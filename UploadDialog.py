@@ -1,10 +1,11 @@
 import os
-import requests
-from qgis.PyQt.QtWidgets import QVBoxLayout, QMessageBox, QDialog, QVBoxLayout, QLabel, QFormLayout, QComboBox, QComboBox, QHBoxLayout, QProgressBar, QTextEdit, QDialog, QVBoxLayout, QPushButton
+from qgis.PyQt.QtWidgets import QVBoxLayout, QMessageBox, QDialog, QVBoxLayout, QLabel, QFormLayout, QComboBox, QComboBox, QHBoxLayout, QProgressBar, QDialog, QVBoxLayout, QPushButton, QListWidget, QListWidgetItem
 from qgis.PyQt.QtGui import QIcon
 from qgis.PyQt.QtCore import Qt
-from qgis.core import QgsProject
-from .util import app_http_login
+from qgis.core import QgsApplication, QgsProject
+from . import api, core
+from .LogView import LogView
+from .UploadTask import UploadTask
 
 class UploadDialog(QDialog):
     def __init__(self, config, selected_server=None):
@@ -47,18 +48,24 @@ class UploadDialog(QDialog):
             self.server_label.setStyleSheet("font-weight: bold; color: #DC143C;")
             
         self.store_dropdown = QComboBox()
+
+        # other servers to push the same store to at once
+        self.mirror_label = QLabel("Also update on:")
+        self.mirror_list = QListWidget()
+        self.mirror_list.setMaximumHeight(80)
         
         self.onServerChanged()
     
         form_layout.addRow(self.server_label)
         form_layout.addRow("Store:", self.store_dropdown)
+        form_layout.addRow(self.mirror_label, self.mirror_list)
     
         self.layout.addLayout(form_layout)
     
         button_box = QHBoxLayout()
-        upload_btn = QPushButton("Upload")
+        self.upload_btn = QPushButton("Upload")
         cancel_btn = QPushButton("Cancel")
-        button_box.addWidget(upload_btn)
+        button_box.addWidget(self.upload_btn)
         button_box.addWidget(cancel_btn)
         self.layout.addLayout(button_box)
     
@@ -68,18 +75,18 @@ class UploadDialog(QDialog):
         self.progress_bar.setVisible(False)
         self.layout.addWidget(self.progress_bar)
 
-        self.log_output = QTextEdit()
-        self.log_output.setReadOnly(True)
-        self.log_output.setMinimumHeight(120)
+        self.log_output = LogView()
         self.log_output.setVisible(False)
         self.layout.addWidget(self.log_output)
     
         self.setLayout(self.layout)
         
-        upload_btn.clicked.connect(self.start_upload)
-        cancel_btn.clicked.connect(self.reject)
+        self.task = None
+        self.upload_btn.clicked.connect(self.start_upload)
+        cancel_btn.clicked.connect(self.onCancel)
     
     def onServerChanged(self):
+        self.setMirrors()
         if not self.selected_server or self.selected_server not in self.config:
             self.store_dropdown.clear()
             return
@@ -98,12 +105,20 @@ class UploadDialog(QDialog):
         self.store_dropdown.addItems(stores)
         self.store_dropdown.blockSignals(False)
 
-    def read_in_chunks(self, file_object, chunk_size=65536):
-        while True:
-            data = file_object.read(chunk_size)
-            if not data:
-                break
-            yield data
+    def setMirrors(self):
+        names = [key for key in self.config.keys() if not key.startswith('_') and key != self.selected_server and isinstance(self.config[key], dict)]
+        self.mirror_list.clear()
+        for name in sorted(names):
+            item = QListWidgetItem(name)
+            item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+            item.setCheckState(Qt.Unchecked)
+            self.mirror_list.addItem(item)
+        self.mirror_label.setVisible(bool(names))
+        self.mirror_list.setVisible(bool(names))
+
+    def mirrors(self):
+        items = [self.mirror_list.item(i) for i in range(self.mirror_list.count())]
+        return [item.text() for item in items if item.checkState() == Qt.Checked]
 
     def start_upload(self):
         server_name = self.selected_server
@@ -124,89 +139,72 @@ class UploadDialog(QDialog):
             return
         project_dir = os.path.dirname(project_path)
         
-        proto = 'https' if server_info['port'] == 443 else 'http'
-
-        s = requests.Session()
-        try:
-            if not app_http_login(s, proto, server_info['host'], server_info['username'], server_info['password']):
-                QMessageBox.warning(None, "Login error", "Failed to login to with " + server_info['username'] + ' to ' + server_info['host'])
-                return
-            
-            response = s.get(proto + '://' + server_info['host'] + '/rest/store/' + store_name, timeout=(10, 30))
-            if response.status_code != 200:
-                response = response.json();
-                QMessageBox.warning(None, "Login error", "Failed to get store info: " + response['message'])
-                return
-
-        except Exception as e:
-            QMessageBox.warning(None, "HTTP error", "Failed on login: " + str(e))
-            return
-
-        store_info = response.json()['store'];
-        
-        file_list = []
-        for root, _, files in os.walk(project_dir):
-            for file in files:
-                local_path = os.path.join(root, file)
-                relative_path = os.path.relpath(local_path, project_dir)
-                
-                try:
-                    file_info = next(item for item in store_info['files'] if item["path"] == relative_path)
-                except StopIteration:   # if file is missing on remote
-                    file_info = {'path':relative_path, 'mtime':0}
-                local_mtime = os.path.getmtime(local_path)
-
-                if int(local_mtime) > file_info['mtime']:
-                    file_list.append((local_path,relative_path));
-        
-        if len(file_list) == 0:
+        self.progress_bar.setMaximum(100)
+        self.progress_bar.setValue(0)
+        self.progress_bar.setFormat("%p%")
+        self.progress_bar.setVisible(True)
+        self.log_output.clear()
+        self.log_output.setVisible(True)
+        self.upload_btn.setEnabled(False)
+
+        mirrors = self.mirrors()
+        if mirrors:
+            servers = {server_name: server_info}
+            for name in mirrors:
+                servers[name] = self.config[name]
+            self.task = UploadTask("Update QCarta store " + store_name + " on " + str(len(servers)) + " servers",
+                lambda task: core.sync_servers(servers, store_name, project_dir, task))
+        else:
+            self.task = UploadTask("Update QCarta store " + store_name, lambda task: core.sync_store(server_info, store_name, project_dir, task))
+        self.task.messagesLogged.connect(self.onMessagesLogged)
+        self.task.progressChanged.connect(lambda progress: self.progress_bar.setValue(int(progress)))
+        self.task.statusChanged.connect(lambda status: self.progress_bar.setFormat("%p% - " + status))
+        self.task.taskCompleted.connect(self.onUploadFinished)
+        self.task.taskTerminated.connect(self.onUploadFinished)
+        QgsApplication.taskManager().addTask(self.task)
+
+    def onMessagesLogged(self, messages):
+        self.log_output.append_messages(messages)
+
+    def onUploadFinished(self):
+        task = self.task
+        self.task = None
+        self.upload_btn.setEnabled(True)
+
+        if task.isCanceled():
+            self.log_output.appendPlainText("Upload cancelled")
+        elif task.error:
+            QMessageBox.critical(None, "Upload Failed", f"An error occurred: {task.error}")
+        elif isinstance(task.result_value, dict):
+            self.showServerResults(task.result_value)
+        elif task.result_value is None:
             QMessageBox.warning(None, "Upload info", "No new files to upload")
-            return
+        elif task.result_value:
+            QMessageBox.information(self, "Upload Complete", "Project directory uploaded successfully.")
+            self.accept()
+        else:
+            QMessageBox.critical(self, "Upload Incomplete", "Project directory wasn't uploaded successfully.")
+            self.accept()
 
-        project_dir = os.path.dirname(project_path)
-        try:
-            self.progress_bar.setMaximum(len(file_list))
-            self.progress_bar.setVisible(True)
-            self.log_output.setVisible(True)
-            
-            store_updated = True
-            chunk_size = store_info['post_max_size'] - 1000
-
-            for i, (local_path,relative_path) in enumerate(file_list):
-                self.progress_bar.setValue(i + 1)
-                try:
-                    with open(local_path, 'rb') as f:
-                        offset = 0
-                        
-                        post_values={'action':'upload_bytes', 'source': os.path.basename(local_path)}
-                        
-                        for chunk in self.read_in_chunks(f):                                
-                            post_values['start'] = offset
-                            post_values['bytes'] = chunk
-                            response = s.post(proto + '://' + server_info['host'] + '/admin/action/upload.php', data=post_values);
-                            if response.status_code != 200:
-                                raise Exception("Chunk upload failed")
-                            offset = offset + len(chunk)
-                    
-                    post_values={'id':store_info['id'], 'action':'update_file', 'relative_path': relative_path, 'mtime': os.path.getmtime(local_path)}
-                    response = s.post(proto + '://' + server_info['host'] + '/admin/action/qgs.php', data=post_values, timeout=(10, 30));
-                    if response.status_code != 200:
-                        raise Exception("Store update failed")
-
-                    self.log_output.append(f"✔ Uploaded: {relative_path}")
-
-                except Exception as e:
-                    store_updated = False
-                    self.log_output.append(f"✖ Failed to upload {relative_path}: {e}")
-            
-            if store_updated:
-                QMessageBox.information(self, "Upload Complete", "Project directory uploaded successfully.")
+    def showServerResults(self, results):
+        lines = []
+        for name, result in results.items():
+            if result is None:
+                lines.append(f"{name}: no new files")
             else:
-                QMessageBox.critical(self, "Upload Incomplete", "Project directory wasn't uploaded successfully.")
+                lines.append(f"{name}: " + ("uploaded" if result else "failed"))
 
-            self.accept()
-        except Exception as e:
-            QMessageBox.critical(None, "Upload Failed", f"An error occurred: {e}")
+        if False in results.values():
+            QMessageBox.critical(self, "Upload Incomplete", "Project directory wasn't uploaded to all servers.\n\n" + "\n".join(lines))
+        else:
+            QMessageBox.information(self, "Upload Complete", "\n".join(lines))
+        self.accept()
+
+    def onCancel(self):
+        if self.task:
+            self.task.cancel()
+        else:
+            self.reject()
         
     def get_stores(self, server_info):
         rv = {}
@@ -214,13 +212,8 @@ class UploadDialog(QDialog):
         if not server_info or not isinstance(server_info, dict):
             return rv
             
-        proto = 'https' if server_info.get('port', 443) == 443 else 'http'
         try:
-            response = requests.get(proto + '://' + server_info['host'] + '/rest/stores', auth=(server_info['username'], server_info['password']), timeout=(10, 30))
-            if response.status_code == 200:
-                response = response.json()
-                for s in response['stores']['store']:
-                    rv[s['name']] = s
+            rv = api.get_stores(server_info)
         except Exception as e:
             QMessageBox.critical(None, "HTTP Error", f"An error occurred: {e}")
 
@@ -0,0 +1,69 @@
+import time
+import threading
+from qgis.PyQt.QtCore import pyqtSignal
+from qgis.core import QgsTask
+from .progress import TransferProgress
+
+# seconds between progress updates sent to the GUI
+PROGRESS_INTERVAL = 0.25
+
+class UploadTask(QgsTask):
+    """
+    Runs an upload job in the background.
+
+    job(task) runs on a worker thread and must not touch widgets. It logs
+    with log() and reports bytes through the TransferProgress returned by
+    track(), which upload workers may update from their own threads. Both
+    are buffered and sent to the GUI at most every PROGRESS_INTERVAL seconds,
+    the progress summary through statusChanged. The job stops early when
+    isCanceled() becomes True. Its return value ends up in task.result_value,
+    and the message of an exception it raises in task.error.
+    """
+    messagesLogged = pyqtSignal(list)
+    statusChanged = pyqtSignal(str)
+
+    def __init__(self, description, job):
+        super().__init__(description, QgsTask.CanCancel)
+        self.job = job
+        self.progress = None
+        self.messages = []
+        self.last_flush = 0
+        self.lock = threading.Lock()
+        self.result_value = None
+        self.error = None
+
+    def run(self):
+        try:
+            self.result_value = self.job(self)
+        except Exception as e:
+            self.error = str(e)
+            return False
+        finally:
+            self.flush()
+        return not self.isCanceled()
+
+    def track(self, sizes, progress_class=TransferProgress):
+        """Start reporting the progress of files with the given {relative_path: size}"""
+        self.progress = progress_class(sizes, self.throttled_flush)
+        self.flush()
+        return self.progress
+
+    def log(self, message):
+        with self.lock:
+            self.messages.append(message)
+        self.throttled_flush()
+
+    def throttled_flush(self):
+        if time.monotonic() - self.last_flush >= PROGRESS_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            self.last_flush = time.monotonic()
+            messages = self.messages
+            self.messages = []
+        if messages:
+            self.messagesLogged.emit(messages)
+        if self.progress:
+            self.setProgress(100.0 * self.progress.fraction())
+            self.statusChanged.emit(self.progress.summary())
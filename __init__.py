@@ -1 +1,4 @@
-from .qcarta_main import classFactory
+def classFactory(iface):
+    # imported here, so the Qt-free modules can be used without QGIS
+    from .qcarta_main import classFactory
+    return classFactory(iface)
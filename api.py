@@ -0,0 +1,110 @@
+from .cache import MetadataCache, resource_ttl
+from .session import get_session
+
+# metadata of all servers, shared by the dialogs
+cache = MetadataCache()
+
+def base_url(server_info):
+    proto = 'https' if server_info.get('port', 443) == 443 else 'http'
+    return proto + '://' + server_info['host']
+
+def server_key(server_info):
+    return server_info['host'] + ':' + str(server_info.get('port', 443)) + '/'
+
+def check(response):
+    """JSON of a QCarta response, raising with its message if it failed"""
+    if response.status_code != 200:
+        try:
+            message = response.json()['message']
+        except Exception:
+            message = "HTTP code " + str(response.status_code)
+        raise Exception(message)
+    response = response.json()
+    if not response.get('success', True):
+        raise Exception(response.get('message', "Request failed"))
+    return response
+
+def cached(server_info, path, request, parse, ttl=None):
+    """
+    Cached metadata resource of a server. request(s, url, headers) sends the
+    request and parse(json) extracts the value, ttl overrides the TTL of the
+    resource, 0 always asks the server.
+    """
+    url = base_url(server_info)
+    # the session is only needed, and logged in, on a cache miss
+    return cache.get(server_key(server_info) + path,
+        lambda headers: request(get_session(server_info), url, headers),
+        lambda response: parse(check(response)),
+        resource_ttl(path) if ttl is None else ttl,
+        server_info.get('disk_cache', False))
+
+def invalidate(server_info, path=''):
+    """Forget cached metadata of a server after we changed it, all of it if path is empty"""
+    cache.invalidate(server_key(server_info) + path)
+
+def get_stores(server_info, ttl=None):
+    """Stores of the server by name"""
+    def parse(response):
+        rv = {}
+        for store in response['stores']['store']:
+            rv[store['name']] = store
+        return rv
+    return cached(server_info, 'stores',
+        lambda s, url, headers: s.get(url + '/rest/stores', headers=headers, timeout=(10, 30)),
+        parse, ttl)
+
+def get_store_info(server_info, store_name, ttl=None):
+    return cached(server_info, 'store/' + store_name,
+        lambda s, url, headers: s.get(url + '/rest/store/' + store_name, headers=headers, timeout=(10, 30)),
+        lambda response: response['store'], ttl)
+
+def get_basemaps(server_info, ttl=None):
+    return cached(server_info, 'basemaps',
+        lambda s, url, headers: s.post(url + '/admin/action/basemap.php', data={'action':'list'}, headers=headers, timeout=(10, 30)),
+        lambda response: response['basemaps'], ttl)
+
+def get_access_groups(server_info, ttl=None):
+    return cached(server_info, 'access_groups',
+        lambda s, url, headers: s.post(url + '/admin/action/access_group.php', data={'action':'list'}, headers=headers, timeout=(10, 30)),
+        lambda response: response['access_groups'], ttl)
+
+# recently selected stores of each server, most recent first
+recent_stores = {}
+MAX_RECENT_STORES = 20
+
+def use_store(server_info, store_name):
+    """Remember that a store was selected, so it's prefetched first next time"""
+    recent = recent_stores.setdefault(server_key(server_info), [])
+    if store_name in recent:
+        recent.remove(store_name)
+    recent.insert(0, store_name)
+    del recent[MAX_RECENT_STORES:]
+
+def prefetch_order(server_info, store_names):
+    """Store names with recently selected ones first"""
+    recent = [name for name in recent_stores.get(server_key(server_info), []) if name in store_names]
+    return recent + [name for name in store_names if name not in recent]
+
+def peek(server_info, path):
+    """Cached value of a resource however old, None if it isn't cached"""
+    return cache.peek(server_key(server_info) + path)
+
+def is_cached(server_info, path):
+    return cache.fresh(server_key(server_info) + path, resource_ttl(path))
+
+# flags of a QCarta layer, sent as 't' when set
+LAYER_OPTIONS = ['public', 'cached', 'proxyfied', 'customized', 'exposed', 'auto_thumbnail', 'show_charts', 'show_dt', 'show_query', 'show_fi_edit']
+
+def publish_layer(server_info, store_id, layers, name, description='', print_layout='', group_ids=(), basemap_id=None, options=()):
+    """Create a QCarta layer from QGIS layers of a store, returns the id of the new layer"""
+    post_data = {'action':'save', 'id': 0, 'store_id': store_id, 'layers[]': list(layers), 'name':name, 'description':description, 'print_layout': print_layout, 'group_id[]':list(group_ids)}
+    if basemap_id is not None:
+        post_data['basemap_id'] = basemap_id
+    for option in options:
+        post_data[option] = 't'
+
+    s = get_session(server_info)
+    return check(s.post(base_url(server_info) + '/admin/action/qgs_layer.php', data=post_data, timeout=(10, 30)))['id']
+
+def layer_url(server_info, layer_id):
+    return base_url(server_info) + '/layers/' + str(layer_id) + '/index.php'
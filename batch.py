@@ -0,0 +1,136 @@
+import os
+import csv
+import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from . import api
+
+TRUE_VALUES = ('1', 't', 'true', 'yes', 'y', 'x')
+REPORT_FIELDS = ['status', 'layer_id', 'error']
+
+def split_list(value):
+    """List of a manifest field, given as a list or as ';' separated text"""
+    if isinstance(value, list):
+        return [str(v).strip() for v in value if str(v).strip()]
+    if value is None:
+        return []
+    return [v.strip() for v in str(value).split(';') if v.strip()]
+
+def parse_flag(value):
+    if isinstance(value, bool):
+        return value
+    return str(value or '').strip().lower() in TRUE_VALUES
+
+def load_manifest(path):
+    """
+    Rows of a CSV or JSON batch publish manifest as dicts.
+
+    Columns are store, layers, name, description, print_layout, basemap,
+    access_groups and the flags of api.LAYER_OPTIONS. layers and
+    access_groups are lists in JSON and ';' separated in CSV, flags are
+    true for 1, t, true, yes, y or x. A report of an earlier run is a
+    manifest too, and its rows with status ok are skipped.
+    """
+    if path.lower().endswith('.json'):
+        with open(path, 'r', encoding='utf-8') as f:
+            rows = json.load(f)
+        if isinstance(rows, dict):
+            rows = rows.get('layers', [])
+    else:
+        with open(path, 'r', newline='', encoding='utf-8-sig') as f:
+            rows = list(csv.DictReader(f))
+
+    manifest = []
+    for row in rows:
+        if not isinstance(row, dict):
+            raise Exception("Manifest rows must be objects")
+        manifest.append({str(k).strip().lower(): v for k, v in row.items() if k is not None})
+    return manifest
+
+def report_path(manifest_path):
+    base = os.path.splitext(manifest_path)[0]
+    if base.endswith('.report'):
+        return base + '.csv'
+    return base + '.report.csv'
+
+def write_report(path, rows):
+    """Write the rows with their status, layer_id and error as CSV"""
+    fields = []
+    for row in rows:
+        for k in row:
+            if k not in fields and k not in REPORT_FIELDS:
+                fields.append(k)
+    fields = REPORT_FIELDS + fields
+
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({k: ';'.join(v) if isinstance(v, list) else v for k, v in row.items()})
+
+class BatchPublisher:
+    """
+    Publishes the layers of a manifest with a bounded pool of workers.
+
+    Store, basemap and access group names are resolved once from the
+    (cached) server metadata. Each row gets status 'ok' with its layer_id
+    or 'failed' with an error, and rows already ok are skipped, so running
+    the same rows again retries only the failures.
+    """
+    def __init__(self, server_info, workers, cancelled=None):
+        self.server_info = server_info
+        self.workers = max(1, workers)
+        self.cancelled = cancelled or (lambda: False)
+
+    def load_names(self):
+        self.stores = api.get_stores(self.server_info)
+        self.basemaps = {b['name']: b['id'] for b in api.get_basemaps(self.server_info)}
+        self.access_groups = {g['name']: g['id'] for g in api.get_access_groups(self.server_info)}
+
+    def lookup(self, names, kind, name):
+        if name not in names:
+            raise Exception(f"Unknown {kind} '{name}'")
+        return names[name]
+
+    def publish(self, row):
+        if self.cancelled():
+            raise Exception("Publish cancelled")
+        name = str(row.get('name') or '').strip()
+        if not name:
+            raise Exception("Missing layer name")
+        store = self.lookup(self.stores, 'store', str(row.get('store') or '').strip())
+        group_ids = [self.lookup(self.access_groups, 'access group', g) for g in split_list(row.get('access_groups'))]
+        if not group_ids:
+            raise Exception("Missing access groups")
+        basemap = str(row.get('basemap') or '').strip()
+        basemap_id = self.lookup(self.basemaps, 'basemap', basemap) if basemap else None
+        options = [option for option in api.LAYER_OPTIONS if parse_flag(row.get(option))]
+
+        return api.publish_layer(self.server_info, store['id'], split_list(row.get('layers')), name,
+            row.get('description') or '', row.get('print_layout') or '', group_ids, basemap_id, options)
+
+    def pending(self, rows):
+        return [i for i, row in enumerate(rows) if row.get('status') != 'ok']
+
+    def run(self, rows):
+        """Publish rows not yet ok, yielding the index of each row as it finishes"""
+        pending = self.pending(rows)
+        if not pending:
+            return
+        self.load_names()
+
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(pending))) as pool:
+            futures = {pool.submit(self.publish, rows[i]): i for i in pending}
+            for future in as_completed(futures):
+                row = rows[futures[future]]
+                try:
+                    row['layer_id'] = future.result()
+                    row['status'] = 'ok'
+                    row['error'] = ''
+                except Exception as e:
+                    row['layer_id'] = ''
+                    row['status'] = 'failed'
+                    row['error'] = str(e)
+                yield futures[future]
+
+        for store_name in set(str(rows[i].get('store') or '').strip() for i in pending):
+            api.invalidate(self.server_info, 'store/' + store_name)
@@ -0,0 +1,100 @@
+import os
+import json
+import uuid
+import tarfile
+from .transfer import MultipartChunk
+
+BUNDLE_THRESHOLD = 256 * 1024
+BUNDLE_MAX_SIZE = 32 * 1024 * 1024
+BUNDLE_MAX_FILES = 1000
+
+def tar_segments(files):
+    """StreamBody segments of an uncompressed tar holding (local_path, relative_path, size, mtime) files"""
+    segments = []
+    for local_path, relative_path, size, mtime in files:
+        info = tarfile.TarInfo(relative_path.replace(os.sep, '/'))
+        info.size = size
+        info.mtime = int(mtime)
+        info.mode = 0o644
+        segments.append(info.tobuf(format=tarfile.PAX_FORMAT, encoding='utf-8'))
+        segments.append((local_path, 0, size))
+        if size % tarfile.BLOCKSIZE:
+            segments.append(b'\0' * (tarfile.BLOCKSIZE - size % tarfile.BLOCKSIZE))
+    segments.append(b'\0' * (2 * tarfile.BLOCKSIZE))
+    return segments
+
+class Bundler:
+    """
+    Packs small files into tar bundles sent with a single request each.
+
+    The tar is streamed from the files as it's sent, without a temporary
+    file, to upload.php and then update_bundle expands it into the store
+    and sets the mtime of every file in one step. Only files whose basename
+    is unique in the upload are bundled, so they can fall back to a plain
+    upload next to other workers if the server doesn't support bundles.
+    """
+    def __init__(self, threshold=BUNDLE_THRESHOLD, max_size=BUNDLE_MAX_SIZE, max_files=BUNDLE_MAX_FILES):
+        self.threshold = threshold
+        self.max_size = max_size
+        self.max_files = max_files
+        self.supported = True
+
+    def split(self, file_list, max_size):
+        """Split (local_path, relative_path) pairs into bundles and files to upload one by one"""
+        max_size = min(self.max_size, max_size)
+        basenames = {}
+        for local_path, relative_path in file_list:
+            name = os.path.basename(local_path)
+            basenames[name] = basenames.get(name, 0) + 1
+
+        bundles = []
+        singles = []
+        bundle = []
+        bundle_size = 0
+        for local_path, relative_path in file_list:
+            try:
+                st = os.stat(local_path)
+            except OSError:
+                singles.append((local_path, relative_path))
+                continue
+            if st.st_size >= self.threshold or basenames[os.path.basename(local_path)] > 1:
+                singles.append((local_path, relative_path))
+                continue
+
+            # headers, data and padding of the file in the tar
+            file_size = 4 * tarfile.BLOCKSIZE + st.st_size
+            if bundle and (bundle_size + file_size > max_size or len(bundle) >= self.max_files):
+                bundles.append(bundle)
+                bundle = []
+                bundle_size = 0
+            bundle.append((local_path, relative_path, st.st_size, st.st_mtime))
+            bundle_size = bundle_size + file_size
+        if bundle:
+            bundles.append(bundle)
+        return bundles, singles
+
+    def upload(self, s, base_url, store_id, bundle):
+        """Send a bundle and expand it in the store, False if the server doesn't support bundles"""
+        if not self.supported:
+            return False
+
+        source = 'bundle_' + uuid.uuid4().hex + '.tar'
+        body = MultipartChunk(tar_segments(bundle), 0, 0, {'action':'upload_bundle', 'source': source, 'start': 0})
+        response = s.post(base_url + '/admin/action/upload.php', data=body, headers={'Content-Type': body.content_type()}, timeout=(10, 60))
+        if response.status_code != 200:
+            self.supported = False
+            return False
+
+        files = [{'relative_path': relative_path, 'mtime': mtime} for local_path, relative_path, size, mtime in bundle]
+        post_values = {'id':store_id, 'action':'update_bundle', 'source': source, 'files': json.dumps(files)}
+        response = s.post(base_url + '/admin/action/qgs.php', data=post_values, timeout=(10, 60))
+        if response.status_code != 200:
+            raise Exception("Store update failed")
+        try:
+            success = response.json().get('success', False)
+        except ValueError:
+            success = False
+        if not success:
+            self.supported = False
+            return False
+        return True
@@ -0,0 +1,195 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+CACHE_FILE = os.path.join(os.path.expanduser("~"), ".qcarta_uploader_cache.sqlite")
+# bytes of responses kept in memory, the least recently used entries are dropped
+MAX_CACHE_BYTES = 32 * 1048576
+# entries kept in CACHE_FILE, the least recently fetched ones are dropped
+MAX_PERSISTED = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    time REAL NOT NULL,
+    etag TEXT,
+    last_modified TEXT
+);
+"""
+
+# seconds a cached resource is used without asking the server
+TTLS = {'stores': 60, 'store': 30, 'basemaps': 300, 'access_groups': 300}
+DEFAULT_TTL = 30
+
+def resource_ttl(path):
+    return TTLS.get(path.split('/')[0], DEFAULT_TTL)
+
+class MetadataCache:
+    """
+    Cache of QCarta metadata responses, keyed by server and resource path.
+
+    An entry is used as is for the TTL of its resource. After that it is
+    revalidated with If-None-Match and If-Modified-Since when the server
+    sent an ETag or Last-Modified, and kept if the server answers 304.
+    Entries of servers with persist set are also written to CACHE_FILE, a
+    row per entry, so they can be revalidated instead of downloaded in the
+    next session. At most MAX_PERSISTED are kept there, and at most
+    MAX_CACHE_BYTES of responses in memory.
+    invalidate() drops entries after our own writes. hits, misses and
+    revalidated count how requests were answered. A request for a key that
+    is already being fetched waits for that response instead of sending
+    its own.
+    """
+    def __init__(self, path=CACHE_FILE):
+        self.path = path
+        self.entries = OrderedDict()
+        self.size = 0
+        self.db = None
+        self.db_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.inflight = {}
+        self.lock = threading.Lock()
+
+    def disk(self, create=False):
+        """Connection to CACHE_FILE, None if it doesn't exist and create isn't set, called with db_lock held"""
+        if self.db is None and (create or os.path.exists(self.path)):
+            os.close(os.open(self.path, os.O_WRONLY | os.O_CREAT, 0o600))
+            self.db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self.db.executescript(SCHEMA)
+        return self.db
+
+    def read(self, key):
+        """Persisted entry of key, None if there is none"""
+        with self.db_lock:
+            try:
+                db = self.disk()
+                row = db and db.execute("SELECT value, time, etag, last_modified FROM entries WHERE key = ?", (key,)).fetchone()
+            except sqlite3.Error:
+                return None
+        if row is None:
+            return None
+        return {'value': json.loads(row[0]), 'time': row[1], 'etag': row[2], 'last_modified': row[3], 'size': len(row[0])}
+
+    def write(self, key, entry):
+        """Persist one entry, dropping the oldest ones beyond MAX_PERSISTED"""
+        value = json.dumps(entry['value'])
+        with self.db_lock:
+            try:
+                db = self.disk(True)
+                with db:
+                    db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                        (key, value, entry['time'], entry['etag'], entry['last_modified']))
+                    db.execute("DELETE FROM entries WHERE key NOT IN (SELECT key FROM entries ORDER BY time DESC LIMIT ?)", (MAX_PERSISTED,))
+            except (OSError, sqlite3.Error):
+                pass
+
+    def lookup(self, key, persist):
+        """Load a persisted entry of key that isn't in memory yet"""
+        with self.lock:
+            if key in self.entries or not persist:
+                return
+        entry = self.read(key)
+        if entry is not None:
+            with self.lock:
+                if key not in self.entries:
+                    self.store(key, entry)
+
+    def store(self, key, entry):
+        """Keep an entry in memory, dropping the least recently used ones beyond MAX_CACHE_BYTES, called with the lock held"""
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.size = self.size - old['size']
+        self.entries[key] = entry
+        self.size = self.size + entry['size']
+        while self.size > MAX_CACHE_BYTES and len(self.entries) > 1:
+            self.size = self.size - self.entries.popitem(last=False)[1]['size']
+
+    def get(self, key, fetch, parse, ttl, persist=False):
+        """
+        Value of key, from cache if fresh. Otherwise fetch(headers) sends the
+        request with the given conditional headers and parse(response) turns
+        a 200 response into the value to cache.
+        """
+        while True:
+            self.lookup(key, persist)
+            with self.lock:
+                entry = self.entries.get(key)
+                if entry is not None and time.time() - entry['time'] < ttl:
+                    self.hits = self.hits + 1
+                    self.entries.move_to_end(key)
+                    return entry['value']
+                fetching = self.inflight.get(key)
+                if fetching is None:
+                    fetching = self.inflight[key] = threading.Event()
+                    break
+            fetching.wait()
+            # the response we waited for is current even for ttl 0, if that fetch failed we send our own
+            ttl = max(ttl, 1)
+
+        try:
+            return self.fetch(key, entry, fetch, parse, persist)
+        finally:
+            with self.lock:
+                self.inflight.pop(key, None)
+            fetching.set()
+
+    def fetch(self, key, entry, fetch, parse, persist):
+        headers = {}
+        if entry is not None:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        response = fetch(headers)
+        if entry is not None and headers and response.status_code == 304:
+            with self.lock:
+                self.revalidated = self.revalidated + 1
+                entry['time'] = time.time()
+            return entry['value']
+
+        value = parse(response)
+        entry = {'value': value, 'time': time.time(), 'size': len(response.content),
+            'etag': response.headers.get('ETag'), 'last_modified': response.headers.get('Last-Modified')}
+        with self.lock:
+            self.misses = self.misses + 1
+            self.store(key, entry)
+        # outside the lock, other requests don't wait for the disk
+        if persist:
+            self.write(key, entry)
+        return value
+
+    def peek(self, key):
+        """Value of key if it's in memory, fresh or not, else None"""
+        with self.lock:
+            entry = self.entries.get(key)
+            return entry['value'] if entry is not None else None
+
+    def fresh(self, key, ttl):
+        """True if key is cached and younger than ttl"""
+        with self.lock:
+            entry = self.entries.get(key)
+            return entry is not None and time.time() - entry['time'] < ttl
+
+    def invalidate(self, prefix):
+        """Drop all entries whose key starts with prefix"""
+        with self.lock:
+            for k in [k for k in self.entries if k.startswith(prefix)]:
+                self.size = self.size - self.entries.pop(k)['size']
+        with self.db_lock:
+            try:
+                db = self.disk()
+                if db:
+                    with db:
+                        db.execute("DELETE FROM entries WHERE substr(key, 1, ?) = ?", (len(prefix), prefix))
+            except sqlite3.Error:
+                pass
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'revalidated': self.revalidated, 'entries': len(self.entries), 'bytes': self.size}
@@ -0,0 +1,218 @@
+"""
+Command line interface to QCarta stores, without QGIS.
+
+Run it with qcarta_cli.py of the plugin directory, whatever that is called,
+or as a module from the directory holding the plugin when the plugin
+directory is named qcarta_qgis_plugin, e.g.
+
+    python /path/to/plugin/qcarta_cli.py --server prod sync mystore /data/project
+
+    python -m qcarta_qgis_plugin.cli --server prod sync mystore /data/project
+    python -m qcarta_qgis_plugin.cli --server prod sync --jobs nightly.csv
+    python -m qcarta_qgis_plugin.cli --server prod --server staging sync mystore /data/project
+    python -m qcarta_qgis_plugin.cli --server prod create --access-group Admin mystore /data/project
+    python -m qcarta_qgis_plugin.cli --server prod publish layers.csv
+    python -m qcarta_qgis_plugin.cli --server prod queue add --jobs release.csv
+    python -m qcarta_qgis_plugin.cli queue run
+
+Servers come from the plugin's config file, or from --host, --username
+and --port with the password in QCARTA_PASSWORD. sync takes several
+servers and pushes to all of them at once. queue works on the job queue
+the plugin's Queue tab shows. The exit status is 0 if
+everything made it, 1 if something failed and 2 for usage errors.
+"""
+import os
+import sys
+import time
+import argparse
+from . import api, core
+from .batch import load_manifest, report_path, write_report
+from .jobqueue import JobQueue, JobRunner, read_jobs
+from .progress import TransferProgress
+from .session import close_sessions
+
+# seconds between progress lines
+PROGRESS_INTERVAL = 10
+
+class UsageError(Exception):
+    pass
+
+class ConsoleReporter(core.Reporter):
+    """Prints the log to stdout and a progress line to stderr now and then"""
+    def __init__(self, quiet=False):
+        self.quiet = quiet
+        self.last_report = time.monotonic()
+
+    def log(self, message):
+        if not self.quiet or message.startswith('✖'):
+            print(message, flush=True)
+
+    def track(self, sizes, progress_class=TransferProgress):
+        self.progress = progress_class(sizes, self.report)
+        return self.progress
+
+    def report(self):
+        if self.quiet or time.monotonic() - self.last_report < PROGRESS_INTERVAL:
+            return
+        self.last_report = time.monotonic()
+        print(f"{100 * self.progress.fraction():.0f}% {self.progress.summary()}", file=sys.stderr, flush=True)
+
+def servers_from_args(args):
+    """{name: server_info} of the servers to work on"""
+    if args.host:
+        password = os.environ.get('QCARTA_PASSWORD')
+        if not args.username or password is None:
+            raise UsageError("--host needs --username and the password in QCARTA_PASSWORD")
+        return {args.host: {'host': args.host, 'username': args.username, 'password': password, 'port': args.port}}
+
+    config = core.load_config(args.config)
+    servers = {}
+    for name in args.server or [config.get('_selected_server')]:
+        if not name or not isinstance(config.get(name), dict):
+            raise UsageError(f"Unknown server '{name}', use --server with a server of {args.config} or --host")
+        servers[name] = config[name]
+    return servers
+
+def single_server(servers, command):
+    if len(servers) != 1:
+        raise UsageError(f"{command} works on one server at a time")
+    return next(iter(servers.values()))
+
+def sync_status(result):
+    if result is None:
+        return "up to date"
+    return "synced" if result else "incomplete"
+
+def cmd_sync(servers, args, reporter):
+    jobs = []
+    if args.jobs:
+        rows = read_jobs(args.jobs)
+        # sync runs on the --server servers, the queue creates stores and picks servers per row
+        other = [row['store'] for row in rows if row['kind'] != 'sync' or row['server'] is not None]
+        if other:
+            raise UsageError(f"{args.jobs} has rows with a server or access_groups ({', '.join(other)}), add them with 'queue add --jobs' instead")
+        jobs = [(row['store'], row['project_dir']) for row in rows]
+    if args.store:
+        if not args.project_dir:
+            raise UsageError("sync needs a project directory after the store")
+        jobs.append((args.store, args.project_dir))
+    if not jobs:
+        raise UsageError("sync needs a store and project directory, or --jobs")
+
+    failed = 0
+    for store_name, project_dir in jobs:
+        started = time.monotonic()
+        if len(servers) > 1:
+            results = core.sync_servers(servers, store_name, os.path.abspath(project_dir), reporter)
+            for name in servers:
+                print(f"{store_name} on {name}: {sync_status(results.get(name, False))}", flush=True)
+            print(f"{store_name}: done in {time.monotonic() - started:.1f}s", flush=True)
+            failed = failed + len([result for result in results.values() if result is False])
+            continue
+
+        try:
+            result = core.sync_store(next(iter(servers.values())), store_name, os.path.abspath(project_dir), reporter)
+        except Exception as e:
+            result = False
+            print(f"✖ {store_name}: {e}", flush=True)
+        print(f"{store_name}: {sync_status(result)} in {time.monotonic() - started:.1f}s", flush=True)
+        failed = failed + (result is False)
+    return 1 if failed else 0
+
+def cmd_create(servers, args, reporter):
+    server_info = single_server(servers, 'create')
+    groups = {g['name']: g['id'] for g in api.get_access_groups(server_info)}
+    unknown = [g for g in args.access_group if g not in groups]
+    if unknown:
+        raise UsageError("Unknown access groups: " + ', '.join(unknown))
+    result = core.create_store(server_info, args.store, os.path.abspath(args.project_dir), [groups[g] for g in args.access_group], reporter)
+    print(f"{args.store}: " + ("created" if result else "created with failed files"), flush=True)
+    return 0 if result else 1
+
+def cmd_publish(servers, args, reporter):
+    server_info = single_server(servers, 'publish')
+    rows = load_manifest(args.manifest)
+    core.publish_layers(server_info, rows, reporter)
+    report = args.report or report_path(args.manifest)
+    write_report(report, rows)
+    failed = len([row for row in rows if row.get('status') != 'ok'])
+    print(f"{len(rows) - failed} of {len(rows)} layers published, report: {report}", flush=True)
+    return 1 if failed else 0
+
+def cmd_queue(servers, args, reporter):
+    queue = JobQueue()
+    if args.action == 'add':
+        if args.host:
+            raise UsageError("queued jobs run on servers of the config file, use --server")
+        name = next(iter(servers))
+        jobs = read_jobs(args.jobs) if args.jobs else []
+        if args.store:
+            if not args.project_dir:
+                raise UsageError("queue add needs a project directory after the store")
+            jobs.append({'kind': 'sync', 'server': None, 'store': args.store, 'project_dir': args.project_dir, 'access_groups': []})
+        if not jobs:
+            raise UsageError("queue add needs a store and project directory, or --jobs")
+        for job in jobs:
+            queue.add(job['kind'], job['server'] or name, job['store'], os.path.abspath(job['project_dir']), job['access_groups'])
+        print(f"{len(jobs)} jobs added, {len(queue.pending())} pending", flush=True)
+        return 0
+
+    if args.action == 'run':
+        failed = JobRunner(queue, core.load_config(args.config), reporter).run()
+        print(f"Queue finished, {failed} jobs failed", flush=True)
+        return 1 if failed else 0
+
+    for job in queue.snapshot():
+        status = job['status'] + (": " + job['error'] if job.get('error') else '')
+        print(f"{job['server']}\t{job['store']}\t{job['project_dir']}\t{job['kind']}\t{status}", flush=True)
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='qcarta', description="Create, sync and publish QCarta stores")
+    parser.add_argument('--config', default=core.CONFIG_FILE, help="plugin config file with the servers")
+    parser.add_argument('--server', action='append', help="server name in the config file, the selected one by default, can be repeated for sync")
+    parser.add_argument('--host', help="server host, instead of --server")
+    parser.add_argument('--username')
+    parser.add_argument('--port', type=int, default=443)
+    parser.add_argument('-q', '--quiet', action='store_true', help="only print failures and results")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    sync = commands.add_parser('sync', help="upload changed files of project directories to their stores")
+    sync.add_argument('store', nargs='?')
+    sync.add_argument('project_dir', nargs='?')
+    sync.add_argument('--jobs', help="CSV with store and project_dir columns, synced one after another, see queue add for server and access_groups columns")
+
+    queue = commands.add_parser('queue', help="add to, list or run the job queue")
+    queue.add_argument('action', choices=['list', 'add', 'run'])
+    queue.add_argument('store', nargs='?')
+    queue.add_argument('project_dir', nargs='?')
+    queue.add_argument('--jobs', help="CSV with store and project_dir columns, optionally server and access_groups, to add")
+
+    create = commands.add_parser('create', help="create a store from a project directory")
+    create.add_argument('store')
+    create.add_argument('project_dir')
+    create.add_argument('--access-group', action='append', required=True, help="access group name, can be repeated")
+
+    publish = commands.add_parser('publish', help="publish the layers of a CSV or JSON manifest")
+    publish.add_argument('manifest')
+    publish.add_argument('--report', help="report file, <manifest>.report.csv by default")
+
+    args = parser.parse_args(argv)
+    reporter = ConsoleReporter(args.quiet)
+    try:
+        # queue jobs name their servers, only adding needs one
+        servers = servers_from_args(args) if args.command != 'queue' or args.action == 'add' else {}
+        return {'sync': cmd_sync, 'create': cmd_create, 'publish': cmd_publish, 'queue': cmd_queue}[args.command](servers, args, reporter)
+    except UsageError as e:
+        parser.error(str(e))
+    except KeyboardInterrupt:
+        print("Interrupted", file=sys.stderr)
+        return 1
+    except Exception as e:
+        print(f"✖ {e}", file=sys.stderr)
+        return 1
+    finally:
+        close_sessions()
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,274 @@
+import os
+import json
+from concurrent.futures import ThreadPoolExecutor
+from . import api
+from .batch import BatchPublisher
+from .bundle import Bundler
+from .delta import DeltaSync
+from .deps import referenced_files
+from .fanout import SharedReads
+from .journal import TransferJournal
+from .planner import plan_sync
+from .progress import GroupedProgress, TransferProgress, format_size
+from .session import get_session
+from .syncindex import SyncIndex
+from .transfer import MIN_CHUNK_SIZE, ChunkSizer, UploadEngine, server_workers, upload_bytes
+
+CONFIG_FILE = os.path.join(os.path.expanduser("~"), ".qcarta_uploader_config.json")
+
+def load_config(path=CONFIG_FILE):
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            return json.load(f)
+    return {}
+
+class Reporter:
+    """
+    Receives what a core operation is doing.
+
+    log() gets a line per file or layer, track() is called with the
+    {key: size} of the work once it's known and returns the
+    progress_class instance workers update, and isCanceled() is polled to stop
+    early. UploadTask provides the same methods for the dialogs.
+    """
+    def log(self, message):
+        pass
+
+    def track(self, sizes, progress_class=TransferProgress):
+        self.progress = progress_class(sizes)
+        return self.progress
+
+    def isCanceled(self):
+        return False
+
+class ServerReporter(Reporter):
+    """Reporter of one server of several, logging to the parent reporter with the server name"""
+    def __init__(self, name, parent):
+        self.name = name
+        self.parent = parent
+
+    def log(self, message):
+        # the mark stays in front, so failures still start with it
+        if message[:1] in ('✔', '✖'):
+            self.parent.log(message[0] + ' ' + self.name + ':' + message[1:])
+        else:
+            self.parent.log(self.name + ': ' + message)
+
+    def isCanceled(self):
+        return self.parent.isCanceled()
+
+def project_files(local_files, project_dir, referenced_only, reporter):
+    """Scanned files of the project directory, with referenced_only just those its projects need"""
+    if not referenced_only:
+        return local_files
+
+    local_files = list(local_files)
+    files, outside = referenced_files(project_dir, local_files)
+    reporter.log(f"{len(files)} of {len(local_files)} files are referenced by the projects")
+    for path in outside:
+        reporter.log(f"Not uploading {path}, it's outside the project directory")
+    return files
+
+def upload_files(s, server_info, store_name, store_info, index, plan, file_list, progress, reporter, opener=None):
+    """Upload (local_path, relative_path) pairs of a plan to a store, True if all of them made it"""
+    proto = 'https' if server_info['port'] == 443 else 'http'
+
+    store_updated = True
+    engine = UploadEngine(s, proto + '://' + server_info['host'], store_info['id'], server_workers(server_info), store_info['post_max_size'],
+        journal=TransferJournal(server_info['host'], store_name),
+        delta=DeltaSync(index, plan) if server_info.get('delta', False) else None,
+        bundler=Bundler() if server_info.get('bundle', False) else None,
+        batch_commits=server_info.get('batch_commits', False),
+        progress=progress,
+        cancelled=reporter.isCanceled,
+        opener=opener)
+    for relative_path, error in engine.run(file_list):
+        if error is None:
+            entry = plan.entries[relative_path]
+            index.record(relative_path, entry.size, entry.mtime_ns, int(entry.mtime), entry.hash)
+            # commit right away, so no write transaction stays open while
+            # other files upload, and a crash keeps the files that made it
+            index.commit()
+            reporter.log(f"✔ Uploaded: {relative_path}")
+        else:
+            store_updated = False
+            reporter.log(f"✖ Failed to upload {relative_path}: {error}")
+    index.commit()
+    return store_updated
+
+def sync_store(server_info, store_name, project_dir, reporter=None):
+    """Upload changed files of the project directory, None if there were none, else True if all of them made it"""
+    reporter = reporter or Reporter()
+    s = get_session(server_info)
+    try:
+        # always revalidated, the file list must be current
+        store_info = api.get_store_info(server_info, store_name, ttl=0)
+    except Exception as e:
+        raise Exception("Failed to get store info: " + str(e))
+
+    index = SyncIndex(server_info['host'], store_name)
+    try:
+        local_files = project_files(index.scan(project_dir), project_dir, server_info.get('referenced_only', False), reporter)
+        plan = plan_sync(local_files, store_info['files'], index, server_info.get('compare_hashes', False))
+        file_list = plan.file_list()
+
+        if len(file_list) == 0:
+            return None
+
+        progress = reporter.track({entry.relative_path: entry.size for entry in plan.uploads()})
+        reporter.log(f"{len(plan.new)} new, {len(plan.modified)} modified, {len(plan.unchanged)} unchanged files, {plan.upload_size() / 1048576:.1f} MB to upload")
+        return upload_files(s, server_info, store_name, store_info, index, plan, file_list, progress, reporter)
+    finally:
+        index.close()
+        api.invalidate(server_info, 'store/' + store_name)
+
+def sync_servers(servers, store_name, project_dir, reporter=None):
+    """
+    Upload changed files of the project directory to the store of the same
+    name on each of the {name: server_info} servers at once.
+
+    The directory is scanned and files are hashed once for all servers, and
+    files going to several servers are read from disk once through a
+    fanout.SharedReads. A server that fails doesn't stop the others.
+    Returns {name: result} with what sync_store would return for each
+    server, and False for servers that failed.
+    """
+    reporter = reporter or Reporter()
+    results = dict.fromkeys(servers, False)
+    indexes = {name: SyncIndex(server_info['host'], store_name) for name, server_info in servers.items()}
+    try:
+        # always revalidated, the file lists must be current
+        with ThreadPoolExecutor(max_workers=max(1, len(servers))) as pool:
+            futures = {name: pool.submit(api.get_store_info, server_info, store_name, 0) for name, server_info in servers.items()}
+        store_infos = {}
+        for name, future in futures.items():
+            try:
+                store_infos[name] = future.result()
+            except Exception as e:
+                results[name] = False
+                reporter.log(f"✖ {name}: Failed to get store info: {e}")
+        if not store_infos:
+            return results
+
+        local_files = list(indexes[next(iter(store_infos))].scan(project_dir))
+        referenced = None
+        hashes = {}
+        plans = {}
+        for name, store_info in store_infos.items():
+            server_info = servers[name]
+            try:
+                files = local_files
+                if server_info.get('referenced_only', False):
+                    if referenced is None:
+                        referenced = project_files(local_files, project_dir, True, reporter)
+                    files = referenced
+                plan = plan_sync(files, store_info['files'], indexes[name], server_info.get('compare_hashes', False), hashes)
+            except Exception as e:
+                results[name] = False
+                reporter.log(f"✖ {name}: {e}")
+                continue
+            file_list = plan.file_list()
+            if len(file_list) == 0:
+                results[name] = None
+                continue
+            plans[name] = (plan, file_list)
+            reporter.log(f"{name}: {len(plan.new)} new, {len(plan.modified)} modified, {len(plan.unchanged)} unchanged files, {plan.upload_size() / 1048576:.1f} MB to upload")
+        if not plans:
+            return results
+
+        progress = reporter.track({(name, entry.relative_path): entry.size for name, (plan, file_list) in plans.items() for entry in plan.uploads()}, GroupedProgress)
+        reads = SharedReads()
+        for plan, file_list in plans.values():
+            for local_path, relative_path in file_list:
+                reads.expect(local_path, 1)
+
+        def upload(name):
+            server_info = servers[name]
+            plan, file_list = plans[name]
+            return upload_files(get_session(server_info), server_info, store_name, store_infos[name], indexes[name], plan, file_list,
+                progress.view(name), ServerReporter(name, reporter), reads.open)
+
+        with ThreadPoolExecutor(max_workers=len(plans)) as pool:
+            futures = {name: pool.submit(upload, name) for name in plans}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                results[name] = False
+                reporter.log(f"✖ {name}: {e}")
+        reporter.log(f"Read {format_size(reads.disk_bytes)} from disk for {format_size(reads.served_bytes)} sent")
+        return results
+    finally:
+        for name, index in indexes.items():
+            index.close()
+            api.invalidate(servers[name], 'store/' + store_name)
+
+def create_store(server_info, store_name, project_dir, access_group_ids, reporter=None):
+    """Create a store from the project directory, True if all files made it"""
+    reporter = reporter or Reporter()
+    proto = 'https' if server_info['port'] == 443 else 'http'
+
+    s = get_session(server_info)
+    index = SyncIndex(server_info['host'], store_name)
+    journal = TransferJournal(server_info['host'], store_name)
+    # post_max_size comes with the store, so until it exists chunks start small and grow
+    sizer = ChunkSizer(initial=MIN_CHUNK_SIZE)
+    try:
+        qgs_list = []
+        file_list = []
+        try:
+            local_files = project_files(index.scan(project_dir), project_dir, server_info.get('referenced_only', False), reporter)
+            plan = plan_sync(local_files, [], None, server_info.get('compare_hashes', False))
+            progress = reporter.track({entry.relative_path: entry.size for entry in plan.new})
+            for entry in plan.new:
+                file = os.path.basename(entry.local_path)
+                if file.endswith('.qgs'):
+                    qgs_list.append(file)
+                    # staged under its basename, like the files of any other upload
+                    journal.claim(entry.relative_path)
+                    upload_bytes(s, proto + '://' + server_info['host'], entry.local_path, sizer,
+                        on_chunk=lambda o, rel=entry.relative_path: progress.set_offset(rel, o), cancelled=reporter.isCanceled)
+                    progress.complete(entry.relative_path)
+                else:
+                    file_list.append((entry.local_path,entry.relative_path));
+        except Exception as e:
+            raise Exception(f"QGS upload failed: {e}")
+
+        # upload .qgs files, so we can create store
+        post_values = {'action':'save', 'name': store_name, 'group_id[]': access_group_ids, 'source[]':qgs_list}
+
+        response = s.post(proto + '://' + server_info['host'] + '/admin/action/qgs.php', data=post_values, timeout=(10,30))
+        if response.status_code != 200:
+            response = response.json();
+            raise Exception("Failed to create store: " + response['message'])
+        api.invalidate(server_info, 'stores')
+
+        # now upload all other files
+        try:
+            response = s.get(proto + '://' + server_info['host'] + '/rest/store/' + store_name, timeout=(10, 30))
+        except Exception as e:
+            raise Exception("Failed to request store info: " + str(e))
+
+        if response.status_code != 200:
+            response = response.json();
+            raise Exception("Failed to get store info: " + response['message'])
+
+        store_info = response.json()['store'];
+        return upload_files(s, server_info, store_name, store_info, index, plan, file_list, progress, reporter)
+    finally:
+        index.close()
+        api.invalidate(server_info, 'store/' + store_name)
+
+def publish_layers(server_info, rows, reporter=None):
+    """Publish the manifest rows not yet published, see batch.load_manifest"""
+    reporter = reporter or Reporter()
+    publisher = BatchPublisher(server_info, server_workers(server_info), reporter.isCanceled)
+    progress = reporter.track({i: 1 for i in publisher.pending(rows)})
+    for i in publisher.run(rows):
+        row = rows[i]
+        if row['status'] == 'ok':
+            reporter.log(f"✔ Published: {row.get('name')}")
+        else:
+            reporter.log(f"✖ Failed to publish {row.get('name') or f'row {i + 1}'}: {row['error']}")
+        progress.complete(i)
+    return rows
@@ -0,0 +1,108 @@
+import os
+import json
+import hashlib
+import threading
+from .transfer import send_range
+
+DELTA_BLOCK_SIZE = 1024 * 1024
+DELTA_MIN_SIZE = 64 * 1024 * 1024
+
+def block_checksums(local_path, block_size=DELTA_BLOCK_SIZE):
+    """Checksums of the fixed size blocks of a file"""
+    checksums = []
+    with open(local_path, 'rb') as f:
+        while True:
+            data = f.read(block_size)
+            if not data:
+                break
+            checksums.append(hashlib.blake2b(data, digest_size=16).hexdigest())
+    return checksums
+
+def changed_runs(old, new):
+    """(first, last) ranges of consecutive blocks of new that differ from old"""
+    runs = []
+    for i, checksum in enumerate(new):
+        if i < len(old) and old[i] == checksum:
+            continue
+        if runs and runs[-1][1] == i:
+            runs[-1][1] = i + 1
+        else:
+            runs.append([i, i + 1])
+    return runs
+
+class DeltaSync:
+    """
+    Sends only the blocks of a large file that changed since its last sync.
+
+    Block checksums are kept in the sync index for every large file we
+    upload. When the server still has the copy they describe, the changed
+    blocks are sent to upload.php at their own offsets and update_file_delta
+    commits them with a manifest of the new size, the sent blocks and all
+    block checksums, so the server can take the other blocks from its copy.
+    Before the first blocks are sent, the server is asked once whether it
+    supports update_file_delta, with a manifest that keeps a file as it is.
+    If it doesn't, files are uploaded whole.
+    """
+    def __init__(self, index, plan, block_size=DELTA_BLOCK_SIZE, min_size=DELTA_MIN_SIZE):
+        self.index = index
+        self.plan = plan
+        self.block_size = block_size
+        self.min_size = min_size
+        self.supported = None
+        self.lock = threading.Lock()
+
+    def base_checksums(self, relative_path):
+        entry = self.plan.entries.get(relative_path)
+        if entry is None:
+            return None
+        return self.index.confirmed_blocks(relative_path, entry.remote_mtime, self.block_size)
+
+    def commit(self, s, base_url, store_id, relative_path, mtime, manifest):
+        """Send update_file_delta, False if the server doesn't support it"""
+        post_values = {'id':store_id, 'action':'update_file_delta', 'relative_path': relative_path, 'mtime': mtime, 'manifest': json.dumps(manifest)}
+        response = s.post(base_url + '/admin/action/qgs.php', data=post_values, timeout=(10, 30))
+        if response.status_code != 200:
+            raise Exception("Store update failed")
+        try:
+            return response.json().get('success', False)
+        except ValueError:
+            return False
+
+    def check_support(self, s, base_url, store_id, relative_path, old):
+        """Ask the server once if it supports update_file_delta, with no blocks, so its copy stays as it is"""
+        with self.lock:
+            if self.supported is None:
+                entry = self.plan.entries[relative_path]
+                manifest = {'size': self.index.files[relative_path]['size'], 'block_size': self.block_size, 'blocks': [], 'checksums': old}
+                self.supported = self.commit(s, base_url, store_id, relative_path, entry.remote_mtime, manifest)
+            return self.supported
+
+    def upload(self, s, base_url, store_id, local_path, relative_path, sizer, cancelled=None):
+        """Send the changed blocks of a file, False if it has to be uploaded whole"""
+        if self.supported is False or os.path.getsize(local_path) < self.min_size:
+            return False
+        old = self.base_checksums(relative_path)
+        if old is None or not self.check_support(s, base_url, store_id, relative_path, old):
+            return False
+
+        st = os.stat(local_path)
+        new = block_checksums(local_path, self.block_size)
+        runs = changed_runs(old, new)
+        with open(local_path, 'rb') as f:
+            for first, last in runs:
+                send_range(s, base_url, f, os.path.basename(local_path), first * self.block_size, min(last * self.block_size, st.st_size), sizer, cancelled=cancelled)
+
+        blocks = [i for first, last in runs for i in range(first, last)]
+        manifest = {'size': st.st_size, 'block_size': self.block_size, 'blocks': blocks, 'checksums': new}
+        if not self.commit(s, base_url, store_id, relative_path, st.st_mtime, manifest):
+            self.supported = False
+            return False
+
+        self.index.record_blocks(relative_path, st.st_mtime_ns, self.block_size, new)
+        return True
+
+    def record(self, relative_path, local_path):
+        """Remember the block checksums of a file uploaded whole"""
+        st = os.stat(local_path)
+        if st.st_size >= self.min_size:
+            self.index.record_blocks(relative_path, st.st_mtime_ns, self.block_size, block_checksums(local_path, self.block_size))
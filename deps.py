@@ -0,0 +1,139 @@
+import os
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+from urllib.parse import urlparse, unquote
+
+PROJECT_EXTENSIONS = ('.qgs', '.qgz')
+# QGIS refers to fonts by family, so font files of the project directory all go
+FONT_EXTENSIONS = ('.ttf', '.otf', '.ttc', '.woff', '.woff2')
+
+# GDAL virtual file systems, as in /vsizip/data.zip/roads.shp
+VSI_PREFIX = re.compile(r'^/vsi\w+/')
+# paths in provider URIs such as dbname='./data.sqlite' table="roads"
+QUOTED_PATH = re.compile(r"\b(?:dbname|file|path)='([^']+)'")
+PATH_LIKE = re.compile(r'[/\\]|\.[A-Za-z][A-Za-z0-9]{0,7}$')
+
+def xml_values(f):
+    """Attribute values and texts of an XML file, read as a stream"""
+    for event, elem in ET.iterparse(f, events=('end',)):
+        for value in elem.attrib.values():
+            yield value
+        if elem.text:
+            yield elem.text
+        # drop what we've read, so memory doesn't grow with the project
+        elem.clear()
+
+def project_values(path):
+    """Values of a .qgs file, or of the .qgs inside a .qgz"""
+    try:
+        if path.lower().endswith('.qgz'):
+            with zipfile.ZipFile(path) as zf:
+                for name in zf.namelist():
+                    if name.lower().endswith('.qgs'):
+                        with zf.open(name) as f:
+                            yield from xml_values(f)
+        else:
+            with open(path, 'rb') as f:
+                yield from xml_values(f)
+    except (ET.ParseError, zipfile.BadZipFile) as e:
+        raise Exception(f"Failed to read project {path}: {e}")
+
+def path_candidates(value):
+    """Parts of a project value that may be paths of files"""
+    value = value.strip()
+    if not value or len(value) > 4096 or '\n' in value:
+        return []
+    quoted = QUOTED_PATH.findall(value)
+    if quoted:
+        return quoted
+    if value.startswith('file:'):
+        return [unquote(urlparse(value).path)]
+    value = VSI_PREFIX.sub('', value).split('|')[0]
+    return [value] if PATH_LIKE.search(value) else []
+
+def referenced_files(project_dir, local_files):
+    """
+    The entries of local_files, as SyncIndex.scan yields them, that the
+    QGIS projects among them need, and the existing files they reference
+    outside project_dir.
+
+    The projects are streamed through, and every attribute value or text
+    that resolves to a file, relative to the project or the project
+    directory, is needed: data sources, SVG and raster symbols, layout
+    pictures and so on. So are files next to a needed file that share its
+    name, such as the parts of a shapefile, styles, world files and the
+    .qgd auxiliary storage of a project, all files of a referenced
+    directory, and font files.
+    """
+    project_dir = os.path.normpath(os.path.abspath(project_dir))
+    entries = {}
+    siblings = {}
+    dirs = set()
+    for entry in local_files:
+        path = os.path.normpath(entry[0])
+        entries[path] = entry
+        siblings.setdefault(os.path.dirname(path), []).append(path)
+    for dir_path in list(siblings):
+        while dir_path.startswith(project_dir + os.sep) and dir_path not in dirs:
+            dirs.add(dir_path)
+            dir_path = os.path.dirname(dir_path)
+
+    needed = set()
+    outside = set()
+    resolved = {}
+
+    def resolve(path):
+        """Files a path stands for"""
+        if path in entries:
+            return [path]
+        if not path.startswith(project_dir + os.sep):
+            return [path] if os.path.isfile(path) else []
+        if path in dirs:
+            return [p for p in entries if p.startswith(path + os.sep)]
+        # a file inside an archive resolves to the archive
+        parent = os.path.dirname(path)
+        while parent.startswith(project_dir + os.sep):
+            if parent in entries:
+                return [parent]
+            parent = os.path.dirname(parent)
+        return []
+
+    for path in list(entries):
+        ext = os.path.splitext(path)[1].lower()
+        if ext in FONT_EXTENSIONS:
+            needed.add(path)
+        if ext not in PROJECT_EXTENSIONS:
+            continue
+
+        needed.add(path)
+        project_base = os.path.dirname(path)
+        for value in project_values(path):
+            if (project_base, value) in resolved:
+                continue
+            files = []
+            for candidate in path_candidates(value):
+                candidate = candidate.replace('\\', '/')
+                for base in (project_base, project_dir):
+                    full = os.path.normpath(os.path.join(base, candidate))
+                    # the project directory itself and its parents are never references
+                    if project_base == full or project_base.startswith(full + os.sep):
+                        continue
+                    found = resolve(full)
+                    if found:
+                        files.extend(found)
+                        break
+            resolved[(project_base, value)] = files
+            for file in files:
+                if file in entries:
+                    needed.add(file)
+                else:
+                    outside.add(file)
+
+    for path in list(needed):
+        prefix = os.path.splitext(os.path.basename(path))[0] + '.'
+        for sibling in siblings.get(os.path.dirname(path), []):
+            if os.path.basename(sibling).startswith(prefix):
+                needed.add(sibling)
+
+    return [entry for path, entry in entries.items() if path in needed], sorted(outside)
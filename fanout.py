@@ -0,0 +1,141 @@
+import os
+import threading
+from collections import OrderedDict
+
+# bytes read from disk at a time and shared between readers
+BLOCK_SIZE = 1048576
+# most bytes of blocks kept for readers that are behind
+MAX_SHARED_BYTES = 64 * 1048576
+
+class SharedFile:
+    """
+    Read-only file whose reads go through a SharedReads.
+
+    It has what StreamBody and upload_bytes use of a file: seek(), read(),
+    fileno() and close(), also as a context manager.
+    """
+    def __init__(self, reads, path):
+        self.reads = reads
+        self.path = path
+        self.f = open(path, 'rb')
+        self.pos = 0
+
+    def fileno(self):
+        return self.f.fileno()
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_SET:
+            self.pos = offset
+        elif whence == os.SEEK_CUR:
+            self.pos = self.pos + offset
+        else:
+            self.pos = os.fstat(self.f.fileno()).st_size + offset
+        return self.pos
+
+    def tell(self):
+        return self.pos
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = os.fstat(self.f.fileno()).st_size - self.pos
+        data = b''
+        while size > 0:
+            index, start = divmod(self.pos, BLOCK_SIZE)
+            block = self.reads.block(self.path, index, self.f)
+            piece = block[start:start + size]
+            if not piece:
+                break
+            data = data + piece if data else piece
+            self.pos = self.pos + len(piece)
+            size = size - len(piece)
+        self.reads.served(len(data))
+        return data
+
+    def close(self):
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+            self.reads.release(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+class SharedReads:
+    """
+    Reads of the same files by several uploads, from disk once.
+
+    expect(path, readers) tells how many uploads will read a file. Blocks
+    of BLOCK_SIZE bytes read by one of them are kept until the others have
+    read the file too, and a block another reader is already reading is
+    waited for instead of read again. At most MAX_SHARED_BYTES are kept, the
+    least recently used blocks are dropped first, so a reader far behind
+    the others reads from disk again instead of holding them up.
+    disk_bytes and served_bytes count bytes read from disk and by readers.
+    """
+    def __init__(self, max_bytes=MAX_SHARED_BYTES):
+        self.max_bytes = max_bytes
+        self.blocks = OrderedDict()
+        self.size = 0
+        self.readers = {}
+        self.loading = {}
+        self.disk_bytes = 0
+        self.served_bytes = 0
+        self.lock = threading.Lock()
+
+    def expect(self, path, readers):
+        with self.lock:
+            self.readers[path] = self.readers.get(path, 0) + readers
+
+    def open(self, path):
+        return SharedFile(self, path)
+
+    def block(self, path, index, f):
+        """Block index of path, reading it with the open file f if nobody has"""
+        key = (path, index)
+        while True:
+            with self.lock:
+                data = self.blocks.get(key)
+                if data is not None:
+                    self.blocks.move_to_end(key)
+                    return data
+                loading = self.loading.get(key)
+                if loading is None:
+                    loading = self.loading[key] = threading.Event()
+                    break
+            # if the block didn't make it into the cache, we read it ourselves
+            loading.wait()
+
+        try:
+            f.seek(index * BLOCK_SIZE)
+            data = f.read(BLOCK_SIZE)
+            with self.lock:
+                self.disk_bytes = self.disk_bytes + len(data)
+                # keep it only if another reader is still to read the file
+                if self.readers.get(path, 0) > 1:
+                    self.blocks[key] = data
+                    self.size = self.size + len(data)
+                    while self.size > self.max_bytes:
+                        self.size = self.size - len(self.blocks.popitem(last=False)[1])
+            return data
+        finally:
+            with self.lock:
+                self.loading.pop(key, None)
+            loading.set()
+
+    def served(self, nbytes):
+        with self.lock:
+            self.served_bytes = self.served_bytes + nbytes
+
+    def release(self, path):
+        """A reader is done with path, its blocks are dropped once all are"""
+        with self.lock:
+            readers = self.readers.get(path, 0) - 1
+            if readers > 0:
+                self.readers[path] = readers
+                return
+            self.readers.pop(path, None)
+            for key in [key for key in self.blocks if key[0] == path]:
+                self.size = self.size - len(self.blocks.pop(key))
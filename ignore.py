@@ -0,0 +1,111 @@
+import re
+
+IGNORE_FILE = '.qcartaignore'
+
+# transient files of QGIS, SQLite, editors and version control, never worth uploading
+DEFAULT_PATTERNS = [
+    '.git/', '.svn/', '.hg/', '__pycache__/', '*.pyc',
+    '*.gpkg-wal', '*.gpkg-shm', '*.sqlite-wal', '*.sqlite-shm', '*.sqlite-journal', '*.db-journal',
+    '*.qgs~', '*.qgz~', '*.lock', '.~lock.*#', '~$*',
+    '.DS_Store', 'Thumbs.db', 'desktop.ini', IGNORE_FILE,
+]
+
+def pattern_regex(pattern):
+    """
+    Regular expression source of a gitignore glob, and whether it's
+    anchored. Anchored ones match '/' separated paths relative to their
+    base, the others just names.
+    """
+    anchored = '/' in pattern
+    pattern = pattern.lstrip('/')
+    regex = ''
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith('**/', i):
+            regex += '(?:.*/)?'
+            i += 3
+        elif pattern.startswith('**', i):
+            regex += '.*'
+            i += 2
+        elif pattern[i] == '*':
+            regex += '[^/]*'
+            i += 1
+        elif pattern[i] == '?':
+            regex += '[^/]'
+            i += 1
+        elif pattern[i] == '[' and ']' in pattern[i + 2:]:
+            end = pattern.index(']', i + 2)
+            regex += '[' + pattern[i + 1:end].replace('!', '^', 1).replace('\\', '\\\\') + ']'
+            i = end + 1
+        else:
+            regex += re.escape(pattern[i])
+            i += 1
+    return '^' + regex + '$', anchored
+
+class IgnoreRules:
+    """
+    gitignore-style rules of files to leave out of a project.
+
+    Each line is a glob matched against the path relative to the
+    directory of its ignore file: without a '/' against the name at any
+    depth, with one against the whole path. A trailing '/' matches only
+    directories, '**' any number of directories, and a leading '!'
+    includes again what an earlier rule ignored. The last matching rule
+    wins. A file inside an ignored directory stays ignored, as the scan
+    doesn't enter that directory. Blank lines and lines starting with
+    '#' are skipped.
+    """
+    def __init__(self, patterns=DEFAULT_PATTERNS):
+        self.rules = []
+        self.groups = None
+        self.add(patterns)
+
+    def add(self, lines, base=''):
+        """Add rules of an ignore file in the directory base, relative to the project"""
+        for line in lines:
+            line = line.rstrip('\n').rstrip('\r')
+            if line.endswith(' ') and not line.endswith('\\ '):
+                line = line.rstrip(' ')
+            if not line or line.startswith('#'):
+                continue
+            negate = line.startswith('!')
+            if negate or line.startswith('\\'):
+                line = line[1:]
+            dir_only = line.endswith('/')
+            line = line.rstrip('/')
+            if line:
+                regex, anchored = pattern_regex(line)
+                self.rules.append((regex, anchored, negate, dir_only, base.replace('\\', '/')))
+        self.groups = None
+
+    def compiled(self):
+        """Rules with consecutive ones of the same kind joined into one regex, newest first"""
+        if self.groups is None:
+            groups = []
+            for regex, anchored, negate, dir_only, base in self.rules:
+                if groups and groups[-1][1:] == (anchored, negate, dir_only, base):
+                    groups[-1][0].append(regex)
+                else:
+                    groups.append(([regex], anchored, negate, dir_only, base))
+            self.groups = [(re.compile('|'.join(regexes)), anchored, negate, dir_only, base) for regexes, anchored, negate, dir_only, base in reversed(groups)]
+        return self.groups
+
+    def load(self, path, base=''):
+        try:
+            with open(path, 'r', encoding='utf-8-sig') as f:
+                self.add(f.readlines(), base)
+        except (OSError, UnicodeDecodeError):
+            pass
+
+    def ignored(self, relative_path, is_dir=False):
+        path = relative_path.replace('\\', '/')
+        name = path.rsplit('/', 1)[-1]
+        # the last matching rule wins
+        for regex, anchored, negate, dir_only, base in self.compiled():
+            if dir_only and not is_dir:
+                continue
+            if base and not path.startswith(base + '/'):
+                continue
+            if regex.match(path[len(base) + 1:] if anchored and base else path if anchored else name):
+                return not negate
+        return False
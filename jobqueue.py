@@ -0,0 +1,367 @@
+import os
+import csv
+import json
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+from . import api, core
+from .progress import TransferProgress
+from .transfer import server_workers
+
+QUEUE_FILE = os.path.join(os.path.expanduser("~"), ".qcarta_uploader_queue.json")
+# upload workers all running jobs share by default
+DEFAULT_BUDGET = 8
+# seconds between checks for jobs added while the queue runs
+POLL_INTERVAL = 1.0
+
+def read_jobs(path):
+    """
+    Jobs of a CSV with store and project_dir columns, and optionally server
+    and access_groups. Rows with access_groups (';' separated) create their
+    store, the others sync it. server is None for rows without one.
+    """
+    jobs = []
+    with open(path, 'r', newline='', encoding='utf-8-sig') as f:
+        for row in csv.DictReader(f):
+            if not row.get('store'):
+                continue
+            groups = [g.strip() for g in (row.get('access_groups') or '').split(';') if g.strip()]
+            jobs.append({'kind': 'create' if groups else 'sync', 'server': (row.get('server') or '').strip() or None,
+                'store': row['store'].strip(), 'project_dir': row['project_dir'].strip(), 'access_groups': groups})
+    return jobs
+
+class FileLock:
+    """
+    Exclusive lock shared with other processes, on a file next to what it
+    guards. It's also exclusive between FileLocks of one process. Works
+    as a with block, or through acquire() which with blocking False returns
+    False instead of waiting when the lock is taken.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.f = None
+
+    def acquire(self, blocking=True):
+        f = os.fdopen(os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600), 'r+b')
+        try:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            else:
+                while True:
+                    try:
+                        msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+                        break
+                    except OSError:
+                        if not blocking:
+                            raise
+                        time.sleep(0.05)
+        except OSError:
+            f.close()
+            return False
+        self.f = f
+        return True
+
+    def release(self):
+        if self.f is not None:
+            if not fcntl:
+                msvcrt.locking(self.f.fileno(), msvcrt.LK_UNLCK, 1)
+            self.f.close()
+            self.f = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+class JobQueue:
+    """
+    Jobs that sync or create stores from project directories, kept in QUEUE_FILE.
+
+    A job is a dict with an id, kind ('sync' or 'create'), server name,
+    store, project_dir, access_groups names for create and a status of
+    pending, running, done or failed, with error and result once it ran.
+    Several processes can share the queue, like the plugin and the command
+    line: every change re-reads the file under a FileLock and writes it back
+    at once, and reads pick up what the others wrote. Only one JobRunner
+    at a time runs the jobs, holding the FileLock of run_lock_path.
+    Jobs that were running when their runner ended are pending again,
+    and resume where they stopped through the transfer journal and sync
+    index. budget is how many upload workers the running jobs share.
+    version changes with every change, so views can tell when to refresh.
+    Methods are thread-safe.
+    """
+    def __init__(self, path=QUEUE_FILE):
+        self.path = path
+        self.run_lock_path = path + '.run'
+        self.lock = threading.Lock()
+        self.file_lock = FileLock(path + '.lock')
+        self.stamp = None
+        self.version = 0
+        self.jobs = []
+        self.budget = DEFAULT_BUDGET
+        with self.lock:
+            self.load()
+
+    def load(self):
+        """Read the queue file if it changed since we last read or wrote it, called with the lock held"""
+        try:
+            st = os.stat(self.path)
+            stamp = (st.st_mtime_ns, st.st_size, st.st_ino)
+            if stamp == self.stamp:
+                return
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        jobs = data.get('jobs', [])
+        # progress is only kept in memory
+        progress = {job['id']: job['progress'] for job in self.jobs if 'progress' in job}
+        runner = None
+        for job in jobs:
+            if job['status'] == 'running':
+                if runner is None:
+                    runner = self.runner_active()
+                if not runner:
+                    job['status'] = 'pending'
+                elif job['id'] in progress:
+                    job['progress'] = progress[job['id']]
+        self.jobs = jobs
+        self.budget = data.get('budget', DEFAULT_BUDGET)
+        self.stamp = stamp
+        self.version = self.version + 1
+
+    def runner_active(self):
+        """True if a JobRunner of any process runs the queue"""
+        run_lock = FileLock(self.run_lock_path)
+        if not run_lock.acquire(blocking=False):
+            return True
+        run_lock.release()
+        return False
+
+    def save(self):
+        """Write the queue, called with the lock and file_lock held, after load()"""
+        self.version = self.version + 1
+        tmp_path = self.path + '.tmp'
+        with os.fdopen(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w') as f:
+            json.dump({'budget': self.budget, 'jobs': [{k: v for k, v in job.items() if k != 'progress'} for job in self.jobs]}, f)
+        os.replace(tmp_path, self.path)
+        st = os.stat(self.path)
+        self.stamp = (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def refresh(self):
+        """Pick up changes other processes made to the queue"""
+        with self.lock:
+            self.load()
+
+    def add(self, kind, server, store, project_dir, access_groups=()):
+        job = {'id': uuid.uuid4().hex, 'kind': kind, 'server': server, 'store': store, 'project_dir': project_dir,
+            'access_groups': list(access_groups), 'status': 'pending', 'error': None, 'result': None, 'added': time.time()}
+        with self.lock, self.file_lock:
+            self.load()
+            self.jobs.append(job)
+            self.save()
+        return job
+
+    def snapshot(self):
+        """Copies of all jobs, in queue order"""
+        with self.lock:
+            self.load()
+            return [dict(job) for job in self.jobs]
+
+    def find(self, job_id):
+        for job in self.jobs:
+            if job['id'] == job_id:
+                return job
+        return None
+
+    def update(self, job_id, **fields):
+        with self.lock, self.file_lock:
+            self.load()
+            job = self.find(job_id)
+            if job is not None:
+                job.update(fields)
+                self.save()
+
+    def set_progress(self, job_id, fraction):
+        """Progress of a running job, only kept in memory"""
+        with self.lock:
+            job = self.find(job_id)
+            if job is not None:
+                job['progress'] = fraction
+                self.version = self.version + 1
+
+    def remove(self, job_ids):
+        """Drop jobs that aren't running"""
+        with self.lock, self.file_lock:
+            self.load()
+            self.jobs = [job for job in self.jobs if job['id'] not in job_ids or job['status'] == 'running']
+            self.save()
+
+    def retry(self, job_ids):
+        """Queue failed or done jobs again"""
+        with self.lock, self.file_lock:
+            self.load()
+            for job in self.jobs:
+                if job['id'] in job_ids and job['status'] in ('done', 'failed'):
+                    job.update(status='pending', error=None, result=None)
+            self.save()
+
+    def clear_finished(self):
+        with self.lock, self.file_lock:
+            self.load()
+            self.jobs = [job for job in self.jobs if job['status'] != 'done']
+            self.save()
+
+    def set_budget(self, budget):
+        with self.lock, self.file_lock:
+            self.load()
+            self.budget = max(1, budget)
+            self.save()
+
+    def pending(self):
+        with self.lock:
+            self.load()
+            return [dict(job) for job in self.jobs if job['status'] == 'pending']
+
+    def take(self, fits):
+        """Mark the first pending job for which fits(job) is True running and return a copy, None if there is none"""
+        with self.lock, self.file_lock:
+            self.load()
+            for job in self.jobs:
+                if job['status'] == 'pending' and fits(job):
+                    job.update(status='running', error=None, progress=0.0)
+                    self.save()
+                    return dict(job)
+        return None
+
+class JobReporter(core.ServerReporter):
+    """Reporter of a queued job, logging with its store name and keeping its progress in the queue"""
+    def __init__(self, queue, job, parent):
+        super().__init__(job['store'], parent)
+        self.queue = queue
+        self.job_id = job['id']
+
+    def track(self, sizes, progress_class=TransferProgress):
+        self.progress = progress_class(sizes, lambda: self.queue.set_progress(self.job_id, self.progress.fraction()))
+        return self.progress
+
+class JobRunner:
+    """
+    Runs the pending jobs of a JobQueue until none are left.
+
+    A job gets the upload workers of its server, at most the queue's
+    budget, and starts once that many are free, so all running jobs
+    together never use more than the budget. Jobs for the same server run
+    one at a time, as upload.php stages the files of all its stores under
+    their basenames, so two jobs sending a project.qgs would mix them up.
+    Jobs added while it runs are picked up. servers is {name: server_info} of the servers jobs name.
+    When reporter.isCanceled() becomes True, running jobs
+    stop after their current chunk and are left pending, so they resume
+    next time.
+    """
+    def __init__(self, queue, servers, reporter=None):
+        self.queue = queue
+        self.servers = servers
+        self.reporter = reporter or core.Reporter()
+        self.used = 0
+        self.running = set()
+        self.failed = 0
+        self.lock = threading.Lock()
+
+    def server_info(self, job):
+        server_info = self.servers.get(job['server'])
+        if not isinstance(server_info, dict):
+            raise Exception(f"Unknown server '{job['server']}'")
+        return server_info
+
+    def workers(self, job):
+        try:
+            return min(server_workers(self.server_info(job)), self.queue.budget)
+        except Exception:
+            # fails as soon as it runs
+            return 1
+
+    def fits(self, job):
+        with self.lock:
+            if job['server'] in self.running:
+                return False
+            return self.used == 0 or self.used + self.workers(job) <= self.queue.budget
+
+    def run_job(self, job, workers):
+        server_info = dict(self.server_info(job), workers=workers)
+        reporter = JobReporter(self.queue, job, self.reporter)
+        project_dir = job['project_dir']
+        if not os.path.isdir(project_dir):
+            raise Exception(f"Project directory {project_dir} doesn't exist")
+
+        # a create job that got as far as creating the store syncs the rest
+        if job['kind'] == 'create' and job['store'] not in api.get_stores(server_info, ttl=0):
+            groups = {g['name']: g['id'] for g in api.get_access_groups(server_info)}
+            unknown = [g for g in job['access_groups'] if g not in groups]
+            if unknown:
+                raise Exception("Unknown access groups: " + ', '.join(unknown))
+            return core.create_store(server_info, job['store'], project_dir, [groups[g] for g in job['access_groups']], reporter)
+        return core.sync_store(server_info, job['store'], project_dir, reporter)
+
+    def failed_job(self):
+        with self.lock:
+            self.failed = self.failed + 1
+
+    def start(self, pool, job):
+        workers = self.workers(job)
+        with self.lock:
+            self.used = self.used + workers
+            self.running.add(job['server'])
+
+        def run():
+            try:
+                result = self.run_job(job, workers)
+                if self.reporter.isCanceled():
+                    self.queue.update(job['id'], status='pending')
+                elif result is False:
+                    self.failed_job()
+                    self.queue.update(job['id'], status='failed', error="Some files failed to upload", result=result)
+                else:
+                    self.queue.update(job['id'], status='done', result=result, finished=time.time())
+                self.reporter.log(f"{'✔' if result is not False else '✖'} {job['store']}: " + ("up to date" if result is None else "done" if result else "incomplete"))
+            except Exception as e:
+                if self.reporter.isCanceled():
+                    self.queue.update(job['id'], status='pending')
+                else:
+                    self.failed_job()
+                    self.queue.update(job['id'], status='failed', error=str(e))
+                    self.reporter.log(f"✖ {job['store']}: {e}")
+            finally:
+                with self.lock:
+                    self.used = self.used - workers
+                    self.running.discard(job['server'])
+        return pool.submit(run)
+
+    def run(self):
+        """Run jobs until the queue has no pending ones, returns how many failed"""
+        run_lock = FileLock(self.queue.run_lock_path)
+        if not run_lock.acquire(blocking=False):
+            raise Exception("The queue is already running, in QGIS or on the command line")
+        try:
+            futures = set()
+            with ThreadPoolExecutor(max_workers=max(1, self.queue.budget)) as pool:
+                while True:
+                    while not self.reporter.isCanceled() and len(futures) < max(1, self.queue.budget):
+                        job = self.queue.take(self.fits)
+                        if job is None:
+                            break
+                        futures.add(self.start(pool, job))
+                    if not futures and (self.reporter.isCanceled() or not self.queue.pending()):
+                        break
+                    done, futures = wait(futures, timeout=POLL_INTERVAL, return_when=FIRST_COMPLETED)
+            return self.failed
+        finally:
+            run_lock.release()
@@ -0,0 +1,130 @@
+import os
+import json
+import time
+import hashlib
+import threading
+
+JOURNAL_FILE = os.path.join(os.path.expanduser("~"), ".qcarta_uploader_journal.json")
+SAMPLE_SIZE = 1024 * 1024
+# seconds between writes of acknowledged offsets
+SAVE_INTERVAL = 5.0
+
+# all journals in the process share the file
+lock = threading.Lock()
+
+def file_fingerprint(local_path):
+    """Size, mtime and a hash of the head and tail of a file"""
+    st = os.stat(local_path)
+    h = hashlib.sha1(str(st.st_size).encode('ascii'))
+    with open(local_path, 'rb') as f:
+        h.update(f.read(SAMPLE_SIZE))
+        if st.st_size > SAMPLE_SIZE:
+            f.seek(max(SAMPLE_SIZE, st.st_size - SAMPLE_SIZE))
+            h.update(f.read(SAMPLE_SIZE))
+    return {'size': st.st_size, 'mtime': st.st_mtime_ns, 'hash': h.hexdigest()}
+
+class TransferJournal:
+    """
+    On-disk record of files being uploaded to a store.
+
+    Each in-flight file keeps the last byte offset acknowledged by the
+    server together with the fingerprint the file had when its upload
+    started. An interrupted upload resumes at that offset, unless the
+    file has changed since, in which case only that file starts over.
+    Offsets are written at most every SAVE_INTERVAL seconds, so a resume
+    may send again what was acknowledged since the last write.
+
+    upload.php stages chunks under the file's basename, so sending any
+    file of that name to the server replaces what was staged. The journal
+    also keeps which file of each server owns the staged data of a
+    basename, shared by all journals and processes. Every file sent to the
+    server must be claimed first, and a file resumes only if it still owns
+    its basename.
+    """
+    def __init__(self, host, store_name, path=JOURNAL_FILE):
+        self.host = host
+        self.key = host + '/' + store_name
+        self.path = path
+        self.entries = self.load().get(self.key, {})
+        self.saved = 0
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self, journal=None):
+        """Write our entries into the journal file, or into journal as just loaded"""
+        if journal is None:
+            journal = self.load()
+        if self.entries:
+            journal[self.key] = self.entries
+        else:
+            journal.pop(self.key, None)
+        staged = journal.get('staged', {})
+        for host in [host for host, names in staged.items() if not names]:
+            del staged[host]
+        if not staged:
+            journal.pop('staged', None)
+
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(journal, f)
+        try:
+            os.chmod(tmp_path, 0o600)
+        except Exception:
+            pass
+        os.replace(tmp_path, self.path)
+        self.saved = time.monotonic()
+
+    def staged(self, journal):
+        """{basename: owner} of the server in a loaded journal"""
+        return journal.setdefault('staged', {}).setdefault(self.host, {})
+
+    def stager(self, relative_path):
+        """Basename upload.php stages the file under, and the file as owner of it"""
+        return relative_path.replace('\\', '/').rsplit('/', 1)[-1], self.key + '/' + relative_path
+
+    def claim(self, relative_path):
+        """Note that a file we don't journal is about to be sent, it replaces what was staged under its basename"""
+        name = self.stager(relative_path)[0]
+        with lock:
+            journal = self.load()
+            staged = self.staged(journal)
+            if staged.pop(name, None) is not None or self.entries.pop(relative_path, None) is not None:
+                self.save(journal)
+
+    def begin(self, relative_path, local_path):
+        """Claim a file and return the offset to resume it from, 0 if it's new, has changed or lost its staged data"""
+        fingerprint = file_fingerprint(local_path)
+        name, owner = self.stager(relative_path)
+        with lock:
+            journal = self.load()
+            staged = self.staged(journal)
+            entry = self.entries.get(relative_path)
+            if entry and staged.get(name) == owner and all(entry.get(k) == v for k, v in fingerprint.items()):
+                return entry['offset']
+            self.entries[relative_path] = dict(fingerprint, offset=0)
+            staged[name] = owner
+            self.save(journal)
+        return 0
+
+    def advance(self, relative_path, offset):
+        with lock:
+            if relative_path in self.entries:
+                self.entries[relative_path]['offset'] = offset
+                if time.monotonic() - self.saved >= SAVE_INTERVAL:
+                    self.save()
+
+    def finish(self, relative_path):
+        """Forget a committed file, the server took its staged data"""
+        name, owner = self.stager(relative_path)
+        with lock:
+            journal = self.load()
+            staged = self.staged(journal)
+            if self.entries.pop(relative_path, None) is not None or staged.get(name) == owner:
+                if staged.get(name) == owner:
+                    del staged[name]
+                self.save(journal)
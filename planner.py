@@ -0,0 +1,136 @@
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+HASH_WORKERS = 4
+
+def hash_file(local_path, block_size=1024 * 1024):
+    """SHA-256 of a file's content"""
+    h = hashlib.sha256()
+    with open(local_path, 'rb') as f:
+        while True:
+            data = f.read(block_size)
+            if not data:
+                break
+            h.update(data)
+    return h.hexdigest()
+
+class PlanEntry:
+    """A file in a sync plan"""
+    __slots__ = ('local_path', 'relative_path', 'size', 'mtime_ns', 'mtime', 'remote_mtime', 'hash')
+
+    def __init__(self, local_path, relative_path, size, mtime_ns, mtime, remote_mtime=0, file_hash=None):
+        self.local_path = local_path
+        self.relative_path = relative_path
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.mtime = mtime
+        self.remote_mtime = remote_mtime
+        self.hash = file_hash
+
+class SyncPlan:
+    """
+    Result of comparing a project directory with a store.
+
+    new: local files missing on the server
+    modified: local files newer than their server copy
+    unchanged: local files already on the server
+    remote_only: server files with no local copy (remote_mtime only)
+    """
+    def __init__(self):
+        self.new = []
+        self.modified = []
+        self.unchanged = []
+        self.remote_only = []
+        self.entries = {}
+
+    def uploads(self):
+        return self.new + self.modified
+
+    def file_list(self):
+        """(local_path, relative_path) pairs to upload"""
+        return [(e.local_path, e.relative_path) for e in self.uploads()]
+
+    def upload_size(self):
+        return sum(e.size for e in self.uploads())
+
+    def unchanged_size(self):
+        return sum(e.size for e in self.unchanged)
+
+def hash_entries(entries, index=None, workers=HASH_WORKERS, hashes=None):
+    """
+    Fill in entry hashes, reusing the ones the index has for the same size
+    and mtime. hashes, if given, is a {(local_path, size, mtime_ns): hash}
+    dict shared by plans of the same files, so each is hashed once.
+    """
+    todo = []
+    for entry in entries:
+        entry.hash = index.cached_hash(entry.relative_path, entry.size, entry.mtime_ns) if index else None
+        if entry.hash is None and hashes is not None:
+            entry.hash = hashes.get((entry.local_path, entry.size, entry.mtime_ns))
+        if entry.hash is None:
+            todo.append(entry)
+
+    # hashlib releases the GIL while hashing, so threads hash in parallel
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for entry, file_hash in zip(todo, pool.map(lambda e: hash_file(e.local_path), todo)):
+            entry.hash = file_hash
+
+    if hashes is not None:
+        for entry in entries:
+            hashes[(entry.local_path, entry.size, entry.mtime_ns)] = entry.hash
+
+def plan_sync(local_files, remote_files, index=None, compare_hashes=False, hashes=None):
+    """
+    Build a SyncPlan from scanned local files and the store's 'files' list.
+
+    local_files yields (local_path, relative_path, size, mtime_ns, mtime)
+    as SyncIndex.scan does. Both sides are indexed by relative path once,
+    so planning is linear in the number of files. With an index, files it
+    has confirmed are unchanged without comparing, files found in sync
+    are recorded and entries of deleted files are dropped.
+
+    With compare_hashes, files the index can't vouch for are compared by
+    content instead of mtime: against the 'hash' the server reports, or
+    else against the hash the index recorded when we last uploaded the
+    file, provided the server copy hasn't changed since. Files whose
+    remote hash is unknown fall back to comparing mtimes. hashes is passed
+    on to hash_entries.
+    """
+    remote = {item['path']: item for item in remote_files}
+
+    plan = SyncPlan()
+    candidates = []
+    for local_path, relative_path, size, mtime_ns, mtime in local_files:
+        item = remote.pop(relative_path, None)
+        entry = PlanEntry(local_path, relative_path, size, mtime_ns, mtime, item['mtime'] if item else 0)
+        plan.entries[relative_path] = entry
+
+        if index and index.is_synced(relative_path, size, mtime_ns, entry.remote_mtime):
+            plan.unchanged.append(entry)
+        else:
+            candidates.append((entry, item))
+
+    if compare_hashes:
+        hash_entries([entry for entry, item in candidates], index, hashes=hashes)
+
+    for entry, item in candidates:
+        remote_hash = None
+        if compare_hashes and item:
+            remote_hash = item.get('hash') or (index.confirmed_hash(entry.relative_path, entry.remote_mtime) if index else None)
+
+        if item is None:
+            plan.new.append(entry)
+        elif (entry.hash != remote_hash) if remote_hash else (int(entry.mtime) > entry.remote_mtime):
+            plan.modified.append(entry)
+        else:
+            plan.unchanged.append(entry)
+            if index:
+                index.record(entry.relative_path, entry.size, entry.mtime_ns, entry.remote_mtime, entry.hash)
+
+    for relative_path, item in remote.items():
+        plan.remote_only.append(PlanEntry(None, relative_path, 0, 0, 0, item['mtime'], item.get('hash')))
+
+    if index:
+        index.forget([p for p in index.files if p not in plan.entries])
+        index.commit()
+    return plan
@@ -0,0 +1,41 @@
+from concurrent.futures import ThreadPoolExecutor
+from . import api
+
+PREFETCH_WORKERS = 2
+
+class StorePrefetcher:
+    """
+    Loads the info of every store of a server into the metadata cache.
+
+    Runs on its own PREFETCH_WORKERS threads, so it never takes more than
+    that many connections from foreground requests. Recently selected
+    stores go first and stores with a fresh cache entry are skipped. A
+    foreground request for a store being prefetched waits for that
+    response. start() drops what's left from the previous call.
+    """
+    def __init__(self, workers=PREFETCH_WORKERS):
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.futures = []
+
+    def start(self, server_info, store_names):
+        self.cancel()
+        for store_name in api.prefetch_order(server_info, store_names):
+            self.futures.append(self.pool.submit(self.fetch, server_info, store_name))
+
+    def fetch(self, server_info, store_name):
+        if api.is_cached(server_info, 'store/' + store_name):
+            return
+        try:
+            api.get_store_info(server_info, store_name)
+        except Exception:
+            # the store is fetched again when it's selected
+            pass
+
+    def cancel(self):
+        for future in self.futures:
+            future.cancel()
+        self.futures = []
+
+    def close(self):
+        self.cancel()
+        self.pool.shutdown(wait=False)
@@ -0,0 +1,125 @@
+import time
+import threading
+from collections import deque
+
+# seconds of transfer history the throughput is averaged over
+RATE_WINDOW = 10.0
+
+def format_size(nbytes):
+    return f"{nbytes / 1048576:.1f} MB"
+
+def format_eta(seconds):
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+    return f"{seconds // 60}:{seconds % 60:02d}"
+
+class TransferProgress:
+    """
+    Byte progress of a transfer across all files of a plan.
+
+    Workers report how far each file got with set_offset() and complete().
+    Throughput is a moving average over the last RATE_WINDOW seconds of
+    bytes actually sent, so resumed or skipped bytes count as done without
+    inflating it. on_change, if given, is called after every update.
+    """
+    def __init__(self, sizes, on_change=None):
+        self.sizes = sizes
+        self.total = sum(sizes.values())
+        self.offsets = {}
+        self.done = 0
+        self.samples = deque()
+        self.started = time.monotonic()
+        self.on_change = on_change
+        self.lock = threading.Lock()
+
+    def set_offset(self, relative_path, offset, measured=True):
+        now = time.monotonic()
+        with self.lock:
+            offset = min(offset, self.sizes.get(relative_path, offset))
+            delta = offset - self.offsets.get(relative_path, 0)
+            if delta <= 0:
+                return
+            self.offsets[relative_path] = offset
+            self.done = self.done + delta
+            self.advanced(relative_path, delta)
+            if measured:
+                self.samples.append((now, delta))
+            while self.samples and now - self.samples[0][0] > RATE_WINDOW:
+                self.samples.popleft()
+        if self.on_change:
+            self.on_change()
+
+    def advanced(self, relative_path, delta):
+        """Called with the lock held when a file got delta bytes further"""
+        pass
+
+    def complete(self, relative_path, measured=False):
+        self.set_offset(relative_path, self.sizes.get(relative_path, 0), measured)
+
+    def fraction(self):
+        return self.done / self.total if self.total else 1.0
+
+    def rate(self):
+        """Bytes per second over the last RATE_WINDOW seconds"""
+        now = time.monotonic()
+        with self.lock:
+            while self.samples and now - self.samples[0][0] > RATE_WINDOW:
+                self.samples.popleft()
+            sent = sum(nbytes for t, nbytes in self.samples)
+        window = min(RATE_WINDOW, now - self.started)
+        return sent / window if window > 0 else 0.0
+
+    def eta(self):
+        """Seconds left at the current rate, None if unknown"""
+        rate = self.rate()
+        return (self.total - self.done) / rate if rate > 0 else None
+
+    def summary(self):
+        text = f"{format_size(self.done)} of {format_size(self.total)}, {self.rate() / 1048576:.1f} MB/s"
+        eta = self.eta()
+        if eta is not None and self.done < self.total:
+            text += ", ETA " + format_eta(eta)
+        return text
+
+class GroupView:
+    """The files of one group of a GroupedProgress, with the interface of a TransferProgress"""
+    def __init__(self, progress, group):
+        self.progress = progress
+        self.group = group
+
+    def set_offset(self, relative_path, offset, measured=True):
+        self.progress.set_offset((self.group, relative_path), offset, measured)
+
+    def complete(self, relative_path, measured=False):
+        self.progress.complete((self.group, relative_path), measured)
+
+class GroupedProgress(TransferProgress):
+    """
+    TransferProgress of files keyed by (group, relative_path), such as the
+    same files going to several servers.
+
+    view(group) gives what an UploadEngine of one group updates, and the
+    summary ends with how far each group got.
+    """
+    def __init__(self, sizes, on_change=None):
+        super().__init__(sizes, on_change)
+        self.group_totals = {}
+        self.group_done = {}
+        for (group, relative_path), size in sizes.items():
+            self.group_totals[group] = self.group_totals.get(group, 0) + size
+            self.group_done.setdefault(group, 0)
+
+    def advanced(self, key, delta):
+        self.group_done[key[0]] = self.group_done[key[0]] + delta
+
+    def view(self, group):
+        return GroupView(self, group)
+
+    def group_fraction(self, group):
+        total = self.group_totals.get(group, 0)
+        return self.group_done.get(group, 0) / total if total else 1.0
+
+    def summary(self):
+        groups = ', '.join(f"{group} {100 * self.group_fraction(group):.0f}%" for group in self.group_totals)
+        return super().summary() + " (" + groups + ")"
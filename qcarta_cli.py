@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+"""
+Runs the command line interface of cli.py, whatever the plugin directory
+is called, e.g.
+
+    python /path/to/plugin/qcarta_cli.py --server prod sync mystore /data/project
+"""
+import os
+import sys
+import importlib
+import importlib.util
+
+PACKAGE = 'qcarta_qgis_plugin'
+
+def load_package():
+    """Import the plugin directory as PACKAGE, so its modules' relative imports work"""
+    plugin_dir = os.path.dirname(os.path.abspath(__file__))
+    spec = importlib.util.spec_from_file_location(PACKAGE, os.path.join(plugin_dir, '__init__.py'), submodule_search_locations=[plugin_dir])
+    package = importlib.util.module_from_spec(spec)
+    sys.modules[PACKAGE] = package
+    spec.loader.exec_module(package)
+    return package
+
+if __name__ == '__main__':
+    load_package()
+    sys.exit(importlib.import_module(PACKAGE + '.cli').main())
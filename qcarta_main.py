@@ -4,13 +4,16 @@ from qgis.PyQt.QtWidgets import QAction
 from qgis.PyQt.QtGui import QIcon
 
 from .TabbedConsole import QCartaConsole
+from .QueueDialog import get_runner
+from .core import CONFIG_FILE
+from .session import close_sessions
 
-CONFIG_FILE = os.path.join(os.path.expanduser("~"), ".qcarta_uploader_config.json")
 
 class AcugisQCartaPlugin:
     def __init__(self, iface):
         self.iface = iface
         self.console_action = None
+        self.console = None
 
     def initGui(self):
         plugin_dir = os.path.dirname(__file__)
@@ -29,6 +32,10 @@ class AcugisQCartaPlugin:
         except Exception:
             self.iface.addPluginToMenu("&QCarta", self.console_action)
 
+        # pick up jobs left over when QGIS was closed
+        if get_runner().queue.pending():
+            get_runner().start()
+
     def unload(self):
         if self.console_action:
             try:
@@ -37,6 +44,11 @@ class AcugisQCartaPlugin:
                 self.iface.removePluginMenu("&QCarta", self.console_action)
             self.iface.removeToolBarIcon(self.console_action)
             self.console_action = None
+        if self.console:
+            self.console.close()
+            self.console = None
+        get_runner().stop()
+        close_sessions()
 
     def load_config(self):
         if os.path.exists(CONFIG_FILE):
@@ -53,9 +65,14 @@ class AcugisQCartaPlugin:
             pass
 
     def open_console(self):
+        # uploads run in the background, so keep the console modeless and QGIS usable
+        if self.console and self.console.isVisible():
+            self.console.raise_()
+            self.console.activateWindow()
+            return
         config = self.load_config()
-        dlg = QCartaConsole(config, parent=self.iface.mainWindow(), save_callback=self.save_config)
-        dlg.exec_()
+        self.console = QCartaConsole(config, parent=self.iface.mainWindow(), save_callback=self.save_config)
+        self.console.show()
 
 def classFactory(iface):
     return AcugisQCartaPlugin(iface)
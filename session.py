@@ -0,0 +1,148 @@
+import os
+import json
+import time
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from .transfer import MAX_WORKERS
+from .util import app_http_login
+
+SESSION_FILE = os.path.join(os.path.expanduser("~"), ".qcarta_uploader_sessions.json")
+
+# connections kept open per host, enough for all upload workers and a few metadata requests
+POOL_SIZE = MAX_WORKERS + 4
+
+# all sessions in the process share the file
+file_lock = threading.Lock()
+
+def load_cookies(path=SESSION_FILE):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_cookies(key, cookies, path=SESSION_FILE):
+    """Store the cookies of a server, or forget them if there are none"""
+    with file_lock:
+        saved = load_cookies(path)
+        if cookies:
+            saved[key] = cookies
+        else:
+            saved.pop(key, None)
+
+        # the cookies are as good as the password, so never let others read them
+        tmp_path = path + '.tmp'
+        with os.fdopen(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w') as f:
+            json.dump(saved, f)
+        try:
+            os.chmod(tmp_path, 0o600)
+        except Exception:
+            pass
+        os.replace(tmp_path, path)
+
+class ServerSession(requests.Session):
+    """
+    Logged in session to a QCarta server, shared by all dialogs and workers.
+
+    Connections are kept alive in a pool of POOL_SIZE per host. A request
+    answered with 401 or a redirect to the login page means the session
+    expired, so it logs in again and repeats the request once. When several
+    threads hit the expiry together, only the first one logs in.
+
+    Cookies are saved in SESSION_FILE after every login and restored by the
+    next session to the server, even in a later QGIS run. A restored session
+    is trusted without a round trip, as its first request shows whether the
+    server still accepts it and logs in again if it doesn't.
+    """
+    def __init__(self, server_info, path=SESSION_FILE):
+        super().__init__()
+        self.host = server_info['host']
+        self.username = server_info['username']
+        self.password = server_info['password']
+        self.proto = 'https' if server_info.get('port', 443) == 443 else 'http'
+        self.base_url = self.proto + '://' + self.host
+        self.key = self.username + '@' + self.host + ':' + str(server_info.get('port', 443))
+        self.path = path
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE)
+        self.mount('http://', adapter)
+        self.mount('https://', adapter)
+        self.login_lock = threading.Lock()
+        self.logins = 0
+
+    def login(self, logins=None):
+        """Log in, unless another thread did since logins was read"""
+        with self.login_lock:
+            if logins is not None and logins != self.logins:
+                return
+            self.cookies.clear()
+            if not app_http_login(self, self.proto, self.host, self.username, self.password):
+                save_cookies(self.key, None, self.path)
+                raise Exception("Failed to login to with " + self.username + ' to ' + self.host)
+            self.logins = self.logins + 1
+            self.save()
+
+    def ensure_login(self):
+        if not self.logins and not self.restore():
+            self.login(0)
+
+    def restore(self):
+        """Take the saved cookies of the server, True if there were any"""
+        now = time.time()
+        cookies = [c for c in load_cookies(self.path).get(self.key, []) if not c.get('expires') or c['expires'] > now]
+        with self.login_lock:
+            if self.logins or not cookies:
+                return bool(self.logins)
+            for c in cookies:
+                self.cookies.set(c['name'], c['value'], domain=c['domain'], path=c['path'], secure=c['secure'], expires=c['expires'])
+            self.logins = 1
+        return True
+
+    def save(self):
+        cookies = [{'name': c.name, 'value': c.value, 'domain': c.domain, 'path': c.path, 'secure': c.secure, 'expires': c.expires} for c in self.cookies]
+        save_cookies(self.key, cookies, self.path)
+
+    def expired(self, response):
+        if response.status_code == 401:
+            return True
+        return bool(response.history) and response.url.find('/login.php') != -1
+
+    def request(self, method, url, *args, **kwargs):
+        logins = self.logins
+        response = super().request(method, url, *args, **kwargs)
+        if not logins or url.find('/login.php') != -1 or not self.expired(response):
+            return response
+
+        data = kwargs.get('data')
+        if hasattr(data, 'read'):
+            if not hasattr(data, 'rewind'):
+                return response
+            data.rewind()
+        self.login(logins)
+        return super().request(method, url, *args, **kwargs)
+
+sessions = {}
+lock = threading.Lock()
+
+def get_session(server_info):
+    """Logged in ServerSession of a server, created on first use"""
+    key = (server_info['host'], server_info.get('port', 443), server_info['username'])
+    with lock:
+        s = sessions.get(key)
+        if s is not None and s.password != server_info['password']:
+            s.close()
+            s = None
+        if s is None:
+            s = ServerSession(server_info)
+            sessions[key] = s
+    s.ensure_login()
+    return s
+
+def close_sessions():
+    with lock:
+        for s in sessions.values():
+            if s.logins:
+                # the server may have renewed the cookies since the login
+                s.save()
+            s.close()
+        sessions.clear()
@@ -0,0 +1,198 @@
+import os
+import json
+import sqlite3
+import threading
+from .ignore import IGNORE_FILE, IgnoreRules
+
+INDEX_FILE = os.path.join(os.path.expanduser("~"), ".qcarta_uploader_index.sqlite")
+# seconds a write waits for another connection's write to finish
+BUSY_TIMEOUT = 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    server TEXT NOT NULL,
+    store TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    hash TEXT,
+    remote_mtime INTEGER,
+    PRIMARY KEY (server, store, path)
+);
+CREATE TABLE IF NOT EXISTS dirs (
+    server TEXT NOT NULL,
+    store TEXT NOT NULL,
+    path TEXT NOT NULL,
+    mtime INTEGER NOT NULL,
+    listing TEXT NOT NULL,
+    PRIMARY KEY (server, store, path)
+);
+CREATE TABLE IF NOT EXISTS blocks (
+    server TEXT NOT NULL,
+    store TEXT NOT NULL,
+    path TEXT NOT NULL,
+    mtime INTEGER NOT NULL,
+    block_size INTEGER NOT NULL,
+    checksums TEXT NOT NULL,
+    PRIMARY KEY (server, store, path)
+);
+"""
+
+class SyncIndex:
+    """
+    Local record of what was last synced to a store.
+
+    Files are keyed by server, store and relative path, and remember their
+    size, mtime, content hash and the remote mtime we last confirmed.
+    Large files can also keep the checksums of their blocks for delta uploads.
+    Directory listings are cached by directory mtime, so unchanged
+    directories are not listed again on the next scan.
+    Several indexes can be open on the file at once, for fan-out servers,
+    queued jobs and the dialogs. The file is in WAL mode so reads don't
+    block, and writes are short transactions that wait BUSY_TIMEOUT
+    seconds for each other.
+    """
+    def __init__(self, host, store_name, path=INDEX_FILE):
+        self.server = host
+        self.store = store_name
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, timeout=BUSY_TIMEOUT, check_same_thread=False)
+        try:
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+        except sqlite3.Error:
+            pass
+        self.db.executescript(SCHEMA)
+        try:
+            os.chmod(path, 0o600)
+        except Exception:
+            pass
+        self.files = {}
+        for row in self.db.execute("SELECT path, size, mtime, hash, remote_mtime FROM files WHERE server=? AND store=?", (self.server, self.store)):
+            self.files[row[0]] = {'size': row[1], 'mtime': row[2], 'hash': row[3], 'remote_mtime': row[4]}
+
+    def close(self):
+        self.db.close()
+
+    def listing(self, dir_path, relative_dir, cached_dirs, seen_dirs):
+        """Names of files and subdirectories of a directory, from cache if its mtime didn't change"""
+        mtime = os.stat(dir_path).st_mtime_ns
+        seen_dirs.add(relative_dir)
+        cached = cached_dirs.get(relative_dir)
+        if cached and cached[0] == mtime:
+            return json.loads(cached[1])
+
+        listing = {'files': [], 'dirs': []}
+        with os.scandir(dir_path) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    listing['dirs'].append(entry.name)
+                elif entry.is_file():
+                    listing['files'].append(entry.name)
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO dirs (server, store, path, mtime, listing) VALUES (?, ?, ?, ?, ?)",
+                (self.server, self.store, relative_dir, mtime, json.dumps(listing)))
+        return listing
+
+    def scan(self, project_dir, rules=None):
+        """
+        Yield (local_path, relative_path, size, mtime_ns, mtime) for every
+        file of the project directory that isn't ignored. rules is an
+        ignore.IgnoreRules, the defaults if None, extended by the
+        .qcartaignore files the scan comes across. Ignored directories
+        are not entered.
+        """
+        rules = rules or IgnoreRules()
+        cached_dirs = {}
+        for row in self.db.execute("SELECT path, mtime, listing FROM dirs WHERE server=? AND store=?", (self.server, self.store)):
+            cached_dirs[row[0]] = (row[1], row[2])
+
+        seen_dirs = set()
+        stack = ['']
+        while stack:
+            relative_dir = stack.pop()
+            dir_path = os.path.join(project_dir, relative_dir) if relative_dir else project_dir
+            try:
+                listing = self.listing(dir_path, relative_dir, cached_dirs, seen_dirs)
+            except OSError:
+                continue
+
+            if IGNORE_FILE in listing['files']:
+                rules.load(os.path.join(dir_path, IGNORE_FILE), relative_dir)
+
+            for name in listing['dirs']:
+                relative_path = os.path.join(relative_dir, name) if relative_dir else name
+                if not rules.ignored(relative_path, True):
+                    stack.append(relative_path)
+
+            for name in listing['files']:
+                local_path = os.path.join(dir_path, name)
+                relative_path = os.path.join(relative_dir, name) if relative_dir else name
+                if rules.ignored(relative_path):
+                    continue
+                try:
+                    st = os.stat(local_path)
+                except OSError:
+                    continue
+                yield (local_path, relative_path, st.st_size, st.st_mtime_ns, st.st_mtime)
+
+        with self.lock:
+            for relative_dir in set(cached_dirs) - seen_dirs:
+                self.db.execute("DELETE FROM dirs WHERE server=? AND store=? AND path=?", (self.server, self.store, relative_dir))
+            self.db.commit()
+
+    def is_synced(self, relative_path, size, mtime_ns, remote_mtime):
+        """True if the file is unchanged since we last confirmed it on the server"""
+        entry = self.files.get(relative_path)
+        return entry is not None and entry['size'] == size and entry['mtime'] == mtime_ns and entry['remote_mtime'] == remote_mtime
+
+    def cached_hash(self, relative_path, size, mtime_ns):
+        """Content hash recorded for the file, if its size and mtime are unchanged"""
+        entry = self.files.get(relative_path)
+        if entry is not None and entry['size'] == size and entry['mtime'] == mtime_ns:
+            return entry['hash']
+        return None
+
+    def confirmed_hash(self, relative_path, remote_mtime):
+        """Hash of the content we uploaded, if the server copy is still the one we confirmed"""
+        entry = self.files.get(relative_path)
+        if entry is not None and entry['remote_mtime'] == remote_mtime:
+            return entry['hash']
+        return None
+
+    def record(self, relative_path, size, mtime_ns, remote_mtime, file_hash=None):
+        """Record a file as synced, without file_hash its hash is kept if its size and mtime are unchanged"""
+        with self.lock:
+            if file_hash is None:
+                file_hash = self.cached_hash(relative_path, size, mtime_ns)
+            self.files[relative_path] = {'size': size, 'mtime': mtime_ns, 'hash': file_hash, 'remote_mtime': remote_mtime}
+            self.db.execute("INSERT OR REPLACE INTO files (server, store, path, size, mtime, hash, remote_mtime) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (self.server, self.store, relative_path, size, mtime_ns, file_hash, remote_mtime))
+
+    def confirmed_blocks(self, relative_path, remote_mtime, block_size):
+        """Block checksums of the file, if they describe the copy we confirmed on the server"""
+        entry = self.files.get(relative_path)
+        if entry is None or entry['remote_mtime'] != remote_mtime:
+            return None
+        with self.lock:
+            row = self.db.execute("SELECT mtime, block_size, checksums FROM blocks WHERE server=? AND store=? AND path=?",
+                (self.server, self.store, relative_path)).fetchone()
+        if row is None or row[0] != entry['mtime'] or row[1] != block_size:
+            return None
+        return json.loads(row[2])
+
+    def record_blocks(self, relative_path, mtime_ns, block_size, checksums):
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO blocks (server, store, path, mtime, block_size, checksums) VALUES (?, ?, ?, ?, ?, ?)",
+                (self.server, self.store, relative_path, mtime_ns, block_size, json.dumps(checksums)))
+
+    def forget(self, relative_paths):
+        with self.lock:
+            for relative_path in relative_paths:
+                if self.files.pop(relative_path, None) is not None:
+                    self.db.execute("DELETE FROM files WHERE server=? AND store=? AND path=?", (self.server, self.store, relative_path))
+                    self.db.execute("DELETE FROM blocks WHERE server=? AND store=? AND path=?", (self.server, self.store, relative_path))
+
+    def commit(self):
+        with self.lock:
+            self.db.commit()
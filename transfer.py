@@ -0,0 +1,381 @@
+import os
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+DEFAULT_WORKERS = 4
+MAX_WORKERS = 16
+
+def server_workers(server_info):
+    """Number of parallel uploads configured for a server"""
+    try:
+        workers = int(server_info.get('workers', DEFAULT_WORKERS))
+    except (TypeError, ValueError):
+        workers = DEFAULT_WORKERS
+    return max(1, min(workers, MAX_WORKERS))
+
+MIN_CHUNK_SIZE = 65536
+MAX_CHUNK_SIZE = 256 * 1024 * 1024
+DEFAULT_POST_MAX_SIZE = 8 * 1024 * 1024
+POST_OVERHEAD = 1000
+TARGET_CHUNK_TIME = 2.0
+MAX_RETRIES = 3
+BATCH_SIZE = 200
+
+class ChunkSizer:
+    """
+    Picks the size of the next upload chunk.
+
+    Starts from the server's post_max_size, or from initial when that is
+    only a guess, and follows the measured throughput so that a chunk
+    takes about TARGET_CHUNK_TIME seconds, growing at most twice per chunk
+    and halving after a failed chunk.
+    """
+    def __init__(self, post_max_size=DEFAULT_POST_MAX_SIZE, target=TARGET_CHUNK_TIME, initial=None):
+        try:
+            post_max_size = int(post_max_size)
+        except (TypeError, ValueError):
+            post_max_size = DEFAULT_POST_MAX_SIZE
+        self.max_size = max(MIN_CHUNK_SIZE, min(post_max_size - POST_OVERHEAD, MAX_CHUNK_SIZE))
+        self.chunk_size = self.max_size if initial is None else max(MIN_CHUNK_SIZE, min(initial, self.max_size))
+        self.target = target
+        self.rate = None
+        self.lock = threading.Lock()
+
+    def size(self):
+        return self.chunk_size
+
+    def success(self, nbytes, elapsed):
+        with self.lock:
+            rate = nbytes / max(elapsed, 0.001)
+            self.rate = rate if self.rate is None else 0.7 * self.rate + 0.3 * rate
+            ideal = int(self.rate * self.target)
+            self.chunk_size = max(MIN_CHUNK_SIZE, min(ideal, self.chunk_size * 2, self.max_size))
+
+    def failure(self):
+        with self.lock:
+            self.chunk_size = max(MIN_CHUNK_SIZE, self.chunk_size // 2)
+
+class StreamBody:
+    """
+    File-like request body made of byte strings and file ranges.
+
+    A file range is (file, offset, length), where file is an open file or
+    a path opened only while its range is being sent. Ranges are read as
+    the request is sent, so memory use doesn't depend on the body size.
+    """
+    def __init__(self, segments):
+        self.segments = segments
+        self.size = sum(len(seg) if isinstance(seg, bytes) else seg[2] for seg in segments)
+        self.pos = 0
+        self.segment = 0
+        self.segment_pos = 0
+        self.f = None
+
+    def __len__(self):
+        return self.size - self.pos
+
+    def rewind(self):
+        """Start over, so the body can be sent again"""
+        if self.f is not None and isinstance(self.segments[self.segment][0], str):
+            self.f.close()
+        self.f = None
+        self.pos = 0
+        self.segment = 0
+        self.segment_pos = 0
+
+    def __iter__(self):
+        while True:
+            data = self.read(65536)
+            if not data:
+                break
+            yield data
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.size - self.pos
+        data = b''
+        while size > 0 and self.pos < self.size:
+            piece = self.read_piece(size)
+            data = data + piece if data else piece
+            size = size - len(piece)
+        return data
+
+    def read_piece(self, size):
+        seg = self.segments[self.segment]
+        if isinstance(seg, bytes):
+            piece = seg[self.segment_pos:self.segment_pos + size]
+            seg_len = len(seg)
+        else:
+            f, offset, seg_len = seg
+            if self.f is None:
+                self.f = open(f, 'rb') if isinstance(f, str) else f
+                self.f.seek(offset)
+            piece = self.f.read(min(size, seg_len - self.segment_pos))
+            if seg_len and not piece:
+                raise Exception("File changed during upload")
+
+        self.pos = self.pos + len(piece)
+        self.segment_pos = self.segment_pos + len(piece)
+        if self.segment_pos >= seg_len:
+            if self.f is not None and isinstance(seg[0], str):
+                self.f.close()
+            self.f = None
+            self.segment = self.segment + 1
+            self.segment_pos = 0
+        return piece
+
+class MultipartChunk(StreamBody):
+    """
+    multipart/form-data body holding form fields and a data part.
+
+    The data part has no filename, so the server still receives it as a
+    regular 'bytes' field. It's either a byte range of a file, or a list
+    of segments as StreamBody takes them.
+    """
+    def __init__(self, f, offset, length, fields, name='bytes'):
+        self.boundary = uuid.uuid4().hex
+        head = b''
+        for k, v in fields.items():
+            head += self.part_header(k) + str(v).encode('utf-8') + b'\r\n'
+        head += self.part_header(name, 'application/octet-stream')
+        tail = ('\r\n--' + self.boundary + '--\r\n').encode('ascii')
+        data = f if isinstance(f, list) else [(f, offset, length)]
+        super().__init__([head] + data + [tail])
+
+    def part_header(self, name, content_type=None):
+        header = '--' + self.boundary + '\r\nContent-Disposition: form-data; name="' + name + '"\r\n'
+        if content_type:
+            header += 'Content-Type: ' + content_type + '\r\n'
+        return (header + '\r\n').encode('utf-8')
+
+    def content_type(self):
+        return 'multipart/form-data; boundary=' + self.boundary
+
+def send_range(s, base_url, f, source, offset, end, sizer, on_chunk=None, cancelled=None):
+    """
+    Stream bytes [offset, end) of an open file to upload.php chunk by chunk,
+    retrying failed chunks with a smaller size.
+
+    on_chunk is called with the new offset after every chunk the server
+    has acknowledged. When cancelled() returns True, sending stops between chunks.
+    """
+    retries = 0
+    post_values = {'action':'upload_bytes', 'source': source}
+
+    while offset < end:
+        if cancelled and cancelled():
+            raise Exception("Upload cancelled")
+        length = min(sizer.size(), end - offset)
+        post_values['start'] = offset
+        body = MultipartChunk(f, offset, length, post_values)
+
+        started = time.monotonic()
+        try:
+            response = s.post(base_url + '/admin/action/upload.php', data=body, headers={'Content-Type': body.content_type()}, timeout=(10, 30))
+            if response.status_code != 200:
+                raise Exception("Chunk upload failed")
+        except Exception:
+            sizer.failure()
+            retries = retries + 1
+            if retries > MAX_RETRIES:
+                raise
+            continue
+
+        sizer.success(length, time.monotonic() - started)
+        retries = 0
+        offset = offset + length
+        if on_chunk:
+            on_chunk(offset)
+
+def upload_bytes(s, base_url, local_path, sizer=None, offset=0, on_chunk=None, cancelled=None, opener=None):
+    """Stream a file to upload.php starting at offset, opened with opener(local_path) if given"""
+    if sizer is None:
+        sizer = ChunkSizer()
+
+    with (opener(local_path) if opener else open(local_path, 'rb')) as f:
+        size = os.fstat(f.fileno()).st_size
+        send_range(s, base_url, f, os.path.basename(local_path), offset, size, sizer, on_chunk, cancelled)
+
+class UploadEngine:
+    """
+    Uploads files to a QCarta store with a bounded pool of workers.
+
+    Each file is sent chunk by chunk to upload.php and then committed
+    with update_file, so the commit always follows the file's last chunk.
+    Files sharing a basename are uploaded by the same worker one after
+    another, because upload.php stores chunks under the basename.
+    With a journal, interrupted files larger than a chunk resume at their last acknowledged chunk,
+    with a delta.DeltaSync only the changed blocks of large files are sent,
+    and with a bundle.Bundler small files go out together in tar bundles.
+    A progress.TransferProgress is told how far every file got.
+    With batch_commits, files are committed BATCH_SIZE at a time by
+    update_files, falling back to update_file if the server lacks it.
+    Workers share the session s, so its connection pool should hold at
+    least as many connections as there are workers, like session.ServerSession.
+    When cancelled() returns True, workers stop after their current chunk.
+    Files sent whole are opened with opener(local_path) if given, such as
+    fanout.SharedReads.open to share reads with other engines.
+    """
+    def __init__(self, s, base_url, store_id, workers=DEFAULT_WORKERS, post_max_size=DEFAULT_POST_MAX_SIZE, journal=None, delta=None, bundler=None, batch_commits=False, progress=None, cancelled=None, opener=None):
+        self.s = s
+        self.base_url = base_url
+        self.store_id = store_id
+        self.workers = max(1, workers)
+        self.sizer = ChunkSizer(post_max_size)
+        self.journal = journal
+        self.delta = delta
+        self.bundler = bundler
+        self.batch_commits = batch_commits
+        self.progress = progress
+        self.cancelled = cancelled or (lambda: False)
+        self.opener = opener
+        self.pending = []
+        self.lock = threading.Lock()
+
+    def upload_file(self, local_path, relative_path, batch=False):
+        """Upload and commit a file, False if its commit was left to the next batch"""
+        s = self.s
+        if self.cancelled():
+            raise Exception("Upload cancelled")
+        offset = 0
+        # a file sent in one chunk has nothing to resume
+        journal = self.journal if self.journal and os.path.getsize(local_path) > self.sizer.size() else None
+        if journal:
+            offset = journal.begin(relative_path, local_path)
+        elif self.journal:
+            self.journal.claim(relative_path)
+        if self.delta and self.delta.upload(s, self.base_url, self.store_id, local_path, relative_path, self.sizer, self.cancelled):
+            if self.journal:
+                self.journal.finish(relative_path)
+            return True
+
+        if self.progress:
+            # bytes sent before a resume are done, but weren't sent now
+            self.progress.set_offset(relative_path, offset, measured=False)
+
+        def on_chunk(o):
+            if journal:
+                journal.advance(relative_path, o)
+            if self.progress:
+                self.progress.set_offset(relative_path, o)
+
+        upload_bytes(s, self.base_url, local_path, self.sizer, offset, on_chunk, self.cancelled, self.opener)
+
+        if batch and self.batch_commits:
+            st = os.stat(local_path)
+            with self.lock:
+                self.pending.append((local_path, relative_path, st.st_mtime, st.st_size))
+            return False
+
+        self.commit_file(s, local_path, relative_path)
+        return True
+
+    def commit_file(self, s, local_path, relative_path):
+        post_values = {'id':self.store_id, 'action':'update_file', 'relative_path': relative_path, 'mtime': os.path.getmtime(local_path)}
+        response = s.post(self.base_url + '/admin/action/qgs.php', data=post_values, timeout=(10, 30))
+        if response.status_code != 200:
+            raise Exception("Store update failed")
+        self.committed(local_path, relative_path)
+
+    def committed(self, local_path, relative_path):
+        if self.journal:
+            self.journal.finish(relative_path)
+        if self.delta:
+            self.delta.record(relative_path, local_path)
+
+    def take_batch(self, full=True):
+        with self.lock:
+            if not self.pending or (full and len(self.pending) < BATCH_SIZE):
+                return []
+            batch = self.pending
+            self.pending = []
+        return batch
+
+    def commit_batch(self, s, batch):
+        """Commit (local_path, relative_path, mtime, size) records with one update_files request"""
+        if not batch:
+            return []
+
+        files = [{'relative_path': relative_path, 'mtime': mtime, 'size': size} for local_path, relative_path, mtime, size in batch]
+        post_values = {'id':self.store_id, 'action':'update_files', 'files': json.dumps(files)}
+        try:
+            response = s.post(self.base_url + '/admin/action/qgs.php', data=post_values, timeout=(10, 60))
+            try:
+                entries = response.json().get('results') if response.status_code == 200 else None
+            except ValueError:
+                entries = None
+        except Exception as e:
+            return [(relative_path, e) for local_path, relative_path, mtime, size in batch]
+
+        results = []
+        if not isinstance(entries, list) or len(entries) != len(batch):
+            # server doesn't support update_files
+            self.batch_commits = False
+            for local_path, relative_path, mtime, size in batch:
+                try:
+                    self.commit_file(s, local_path, relative_path)
+                    results.append((relative_path, None))
+                except Exception as e:
+                    results.append((relative_path, e))
+            return results
+
+        for (local_path, relative_path, mtime, size), entry in zip(batch, entries):
+            if entry.get('success'):
+                self.committed(local_path, relative_path)
+                results.append((relative_path, None))
+            else:
+                results.append((relative_path, Exception(entry.get('message', "Store update failed"))))
+        return results
+
+    def upload_group(self, group, unique_basenames=False):
+        results = []
+        for local_path, relative_path in group:
+            try:
+                # a file can wait for a batch commit only if no other file will be staged under its basename
+                if self.upload_file(local_path, relative_path, batch=unique_basenames or len(group) == 1):
+                    results.append((relative_path, None))
+            except Exception as e:
+                results.append((relative_path, e))
+        return results + self.commit_batch(self.s, self.take_batch())
+
+    def upload_bundle(self, bundle):
+        try:
+            if self.cancelled():
+                raise Exception("Upload cancelled")
+            if self.bundler.upload(self.s, self.base_url, self.store_id, bundle):
+                if self.progress:
+                    for local_path, relative_path, size, mtime in bundle:
+                        self.progress.complete(relative_path, measured=True)
+                return [(relative_path, None) for local_path, relative_path, size, mtime in bundle]
+        except Exception as e:
+            return [(relative_path, e) for local_path, relative_path, size, mtime in bundle]
+        return self.upload_group([(local_path, relative_path) for local_path, relative_path, size, mtime in bundle], True)
+
+    def finished(self, result):
+        # failed and delta uploaded files count as done too, so progress ends at 100%
+        if self.progress:
+            self.progress.complete(result[0])
+        return result
+
+    def run(self, file_list):
+        """Upload (local_path, relative_path) pairs, yielding (relative_path, error) as files finish"""
+        bundles = []
+        if self.bundler:
+            bundles, file_list = self.bundler.split(file_list, self.sizer.max_size)
+
+        groups = {}
+        for local_path, relative_path in file_list:
+            groups.setdefault(os.path.basename(local_path), []).append((local_path, relative_path))
+
+        with ThreadPoolExecutor(max_workers=min(self.workers, max(1, len(groups) + len(bundles)))) as pool:
+            futures = [pool.submit(self.upload_bundle, b) for b in bundles]
+            futures += [pool.submit(self.upload_group, g) for g in groups.values()]
+            for future in as_completed(futures):
+                for result in future.result():
+                    yield self.finished(result)
+
+        for result in self.commit_batch(self.s, self.take_batch(False)):
+            yield self.finished(result)